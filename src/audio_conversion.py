@@ -1,56 +1,318 @@
 #!/usr/bin/env python
 
+import os
 import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 # Importamos variables globales desde config.py
-from .config import MIDI_DIR, WAV_DIR, DEFAULT_SAMPLE_RATE
+from .config import (
+    MIDI_DIR, WAV_DIR, DEFAULT_SAMPLE_RATE, DEFAULT_MAX_WORKERS, DEFAULT_RENDER_BACKEND
+)
+from .midi_io import read_midi_notes
+from .build_cache import BuildManifest, artifact_hash, file_hash, temp_path
+from .synth import read_wav, render_notes, write_wav
+from .corpus import AudioCorpusWriter
+from .metadata import MetadataIndex
+from .layout import file_relpath, folder_artifacts
+from .roman_to_chord import roman_to_chord_label
+from . import instrumentation
 
-def midi_to_wav(midi_file: Path, sample_rate: int = DEFAULT_SAMPLE_RATE) -> Path:
+def _timidity_command(midi_file: Path, wav_file: Path, sample_rate: int) -> list:
     """
-    Convierte un archivo MIDI a formato WAV usando Timidity y lo coloca en WAV_DIR.
-
-    :param midi_file: Path absoluto o relativo del archivo .mid.
-    :param sample_rate: Frecuencia de muestreo (por defecto la de config.py).
-    :return: Ruta absoluta al archivo .wav generado.
+    Construye la línea de comandos de timidity para convertir un .mid a .wav.
     """
-    # Nombre base sin extensión
-    base_name = midi_file.stem
-    # Construct la ruta final en WAV_DIR
-    wav_file = WAV_DIR / f"{base_name}.wav"
-    wav_file.parent.mkdir(parents=True, exist_ok=True)
-
     # Ejecutamos timidity:
     #  -Ow1 => salida WAV con 16 bits
     #  -s <sample_rate> => tasa de muestreo
     #  -o => archivo de salida
-    subprocess.call([
+    return [
         'timidity',
         str(midi_file),
         '-Ow1',
         '-s', str(sample_rate),
         '-o', str(wav_file)
-    ])
+    ]
+
+def _render_timidity(midi_file: Path, wav_file: Path, sample_rate: int) -> tuple:
+    """
+    Backend de referencia: convierte con timidity y retorna (código de salida,
+    stderr). Si el ejecutable no existe, se reporta el código 127 (como haría el shell).
+    """
+    try:
+        result = subprocess.run(
+            _timidity_command(midi_file, wav_file, sample_rate),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE
+        )
+    except OSError as exc:
+        return 127, str(exc)
+    return result.returncode, result.stderr.decode("utf-8", errors="replace").strip()
+
+def _render_synth(midi_file: Path, wav_file: Path, sample_rate: int) -> tuple:
+    """
+    Backend en proceso: lee las notas del .mid y las sintetiza con NumPy.
+    Un .mid ilegible se reporta con código 1, igual que un fallo de timidity.
+    """
+    try:
+        notes = read_midi_notes(midi_file)
+    except (ValueError, IndexError, OSError) as exc:
+        return 1, repr(exc)
+    notes_to_wav(notes, wav_file, sample_rate)
+    return 0, ""
+
+# Backends disponibles: nombre -> función (midi_file, wav_file, sample_rate) -> (código, mensaje)
+RENDER_BACKENDS = {
+    "timidity": _render_timidity,
+    "synth": _render_synth,
+}
+
+def _get_backend(backend: str):
+    if backend not in RENDER_BACKENDS:
+        raise ValueError(
+            f"[audio_conversion] Backend no reconocido: {backend} "
+            f"(opciones: {', '.join(RENDER_BACKENDS)})"
+        )
+    return RENDER_BACKENDS[backend]
+
+def notes_to_wav(notes, wav_file: Path, sample_rate: int = DEFAULT_SAMPLE_RATE) -> Path:
+    """
+    Sintetiza directamente una lista de notas (pitch, inicio_seg, duración_seg, velocity)
+    y la guarda como WAV, sin pasar por un archivo .mid.
+
+    :param notes: Notas de la progresión.
+    :param wav_file: Ruta del .wav de salida.
+    :param sample_rate: Frecuencia de muestreo (por defecto la de config.py).
+    :return: Ruta al archivo .wav generado.
+    """
+    return write_wav(wav_file, render_notes(notes, sample_rate), sample_rate)
 
+def _convert_one(midi_file: Path, sample_rate: int, backend: str, relpath: Path = None) -> tuple:
+    """
+    Convierte un archivo y retorna (wav_file, código de salida, mensaje de error).
+    El backend escribe en un temporal que solo se renombra a wav_file si terminó
+    bien: una conversión interrumpida o fallida nunca deja un .wav a medias.
+
+    :param relpath: Ruta del .wav relativa a WAV_DIR (ver layout.py). Si es None,
+                    se deduce del .mid.
+    """
+    wav_file = WAV_DIR / (relpath or file_relpath(midi_file, ".wav"))
+    wav_file.parent.mkdir(parents=True, exist_ok=True)
+    tmp_file = temp_path(wav_file)
+    try:
+        with instrumentation.timer(f"render.{backend}"):
+            code, error = _get_backend(backend)(midi_file, tmp_file, sample_rate)
+        if code == 0:
+            os.replace(tmp_file, wav_file)
+            if instrumentation.enabled():
+                instrumentation.observe("render.wav_bytes", wav_file.stat().st_size)
+    finally:
+        tmp_file.unlink(missing_ok=True)
+    return wav_file, code, error
+
+def wav_digest(midi_file: Path, sample_rate: int, backend: str) -> str:
+    """
+    Hash de entrada de un .wav para el manifiesto incremental de WAV_DIR.
+    """
+    return artifact_hash(kind="wav", midi=file_hash(midi_file), sample_rate=sample_rate, backend=backend)
+
+def render_files(mid_files: list, sample_rate: int = DEFAULT_SAMPLE_RATE,
+                 backend: str = DEFAULT_RENDER_BACKEND) -> list:
+    """
+    Convierte una lista de .mid, uno tras otro, sin tocar el manifiesto (lo
+    registra quien la llama). Es la unidad de trabajo de render del catálogo.
+
+    :return: Lista de (ruta .mid, ruta del .wav relativa a WAV_DIR, hash de entrada,
+             código de salida, mensaje de error).
+    """
+    _get_backend(backend)
+    results = []
+    for mf in mid_files:
+        mf = Path(mf)
+        relpath = file_relpath(mf, ".wav")
+        digest = wav_digest(mf, sample_rate, backend)
+        _, code, error = _convert_one(mf, sample_rate, backend, relpath)
+        results.append((mf, relpath.as_posix(), digest, code, error))
+    return results
+
+def midi_to_wav(
+    midi_file: Path,
+    sample_rate: int = DEFAULT_SAMPLE_RATE,
+    backend: str = DEFAULT_RENDER_BACKEND
+) -> Path:
+    """
+    Convierte un archivo MIDI a formato WAV y lo coloca en WAV_DIR (en la
+    subcarpeta que corresponda según OUTPUT_LAYOUT).
+
+    :param midi_file: Path absoluto o relativo del archivo .mid.
+    :param sample_rate: Frecuencia de muestreo (por defecto la de config.py).
+    :param backend: 'timidity' (referencia) o 'synth' (sintetizador NumPy en proceso).
+    :return: Ruta absoluta al archivo .wav generado.
+    """
+    wav_file, _, _ = _convert_one(midi_file, sample_rate, backend)
     return wav_file
 
 
-def convert_all_mid_in_folder(folder: Path):
+def _build_corpus(folder: Path, wav_paths: dict, corpus_dir: Path, sample_rate: int,
+                  roman_sequence: list = None):
+    """
+    Vuelca los .wav de los .mid dados ({.mid: .wav relativo a WAV_DIR}) a un
+    corpus memmap, con sus acordes. La tónica, las duraciones (en pulsos) y el
+    tempo salen de metadata.npz; los acordes del corpus van en segundos.
+    """
+    index = MetadataIndex(folder) if MetadataIndex.exists(folder) else None
+    seconds_per_beat = index.seconds_per_beat if index is not None else None
+
+    with AudioCorpusWriter(corpus_dir, sample_rate) as corpus:
+        for mf, relpath in wav_paths.items():
+            audio, _ = read_wav(WAV_DIR / relpath)
+            chords = []
+            if index is not None:
+                i = index.row(mf.name)
+                key = index.key(i)
+                start = 0.0
+                for c, dur in enumerate(index.durations[i].tolist()):
+                    label = ""
+                    if roman_sequence and c < len(roman_sequence):
+                        label = roman_to_chord_label(roman_sequence[c], key)
+                    chords.append((start, dur * seconds_per_beat, label))
+                    start += dur * seconds_per_beat
+            corpus.add(mf.stem, audio, chords)
+    print(f"Corpus de {len(wav_paths)} muestras en {corpus_dir}")
+
+
+def convert_all_mid_in_folder(
+    folder: Path,
+    sample_rate: int = DEFAULT_SAMPLE_RATE,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    backend: str = DEFAULT_RENDER_BACKEND,
+    incremental: bool = True,
+    corpus_dir: Path = None,
+    roman_sequence: list = None,
+    retry_failed: bool = False
+) -> dict:
     """
     Convierte todos los archivos .mid en la carpeta dada a formato WAV y
-    los guarda en WAV_DIR.
+    los guarda en WAV_DIR. Lanza hasta `max_workers` conversiones a la vez.
+    Los .mid y las rutas de sus .wav (según OUTPUT_LAYOUT) se leen de
+    metadata.npz; solo las carpetas sin él se recorren buscando .mid.
 
     :param folder: Ruta de la carpeta donde se encuentran archivos .mid.
+    :param sample_rate: Frecuencia de muestreo (por defecto la de config.py).
+    :param max_workers: Número máximo de conversiones simultáneas
+                        (por defecto, el número de CPUs).
+    :param backend: 'timidity' (referencia) o 'synth' (sintetizador NumPy en proceso).
+    :param incremental: Si es True, omite los .wav al día según el manifest.json de
+                        WAV_DIR (hash del .mid + sample rate + backend). Cada .wav se
+                        registra al terminar (journal.jsonl), así que una ejecución
+                        interrumpida continúa donde se quedó.
+    :param corpus_dir: Si se indica, además construye ahí un corpus memmap
+                       (ver corpus.py) con todos los .wav de la carpeta, alineado con
+                       los acordes de metadata.npz (en segundos, como en los .jams).
+    :param roman_sequence: Numerales de la progresión, para etiquetar los acordes del
+                           corpus (la tonalidad es la tónica de cada archivo).
+    :param retry_failed: Si es True, solo se convierten los .mid cuyo .wav falló en
+                         una ejecución anterior (ver BuildManifest.failures); el resto
+                         cuenta como omitido.
+    :return: Resumen con las claves 'total', 'succeeded', 'skipped', 'failed'
+             (lista de (ruta .mid, código de salida)) y 'elapsed' (segundos).
     """
+    summary = {"total": 0, "succeeded": 0, "skipped": 0, "failed": [], "elapsed": 0.0}
+
     if not folder.exists():
         print(f"No existe la carpeta {folder}")
-        return
+        return summary
 
-    mid_files = list(folder.rglob("*.mid"))
-    if not mid_files:
+    wav_paths = folder_artifacts(folder, ".wav")
+    if not wav_paths:
         print(f"No hay archivos .mid en {folder}")
-        return
+        return summary
 
-    for mf in mid_files:
-        # Convertir y avisar
-        output = midi_to_wav(mf)
-        print(f"Convertido: {mf} => {output}")
+    _get_backend(backend)
+    start = time.perf_counter()
+
+    manifest = BuildManifest(WAV_DIR)
+    pending = []
+    for mf, relpath in wav_paths.items():
+        wav_name = relpath.as_posix()
+        if retry_failed and wav_name not in manifest.failures:
+            summary["skipped"] += 1
+            continue
+        with instrumentation.timer("render.hash_midi"):
+            digest = wav_digest(mf, sample_rate, backend)
+        if incremental and manifest.is_fresh(wav_name, digest):
+            summary["skipped"] += 1
+        else:
+            pending.append((mf, relpath, digest))
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        # Con timidity cada hilo solo espera a su subproceso, así que los hilos bastan
+        results = pool.map(lambda item: _convert_one(item[0], sample_rate, backend, item[1]), pending)
+        for (mf, relpath, digest), (_, code, error) in zip(pending, results):
+            if code == 0:
+                summary["succeeded"] += 1
+                manifest.record(relpath.as_posix(), digest)
+            else:
+                summary["failed"].append((mf, code))
+                manifest.record_failure(relpath.as_posix(), digest, code, error)
+    manifest.save()
+
+    if corpus_dir is not None:
+        failed = {mf for mf, _ in summary["failed"]}
+        with instrumentation.timer("render.corpus"):
+            _build_corpus(folder, {mf: rel for mf, rel in wav_paths.items() if mf not in failed},
+                          corpus_dir, sample_rate, roman_sequence)
+
+    summary["total"] = len(wav_paths)
+    summary["elapsed"] = time.perf_counter() - start
+
+    instrumentation.count("render.succeeded", summary["succeeded"])
+    instrumentation.count("render.skipped", summary["skipped"])
+    instrumentation.count("render.failed", len(summary["failed"]))
+    instrumentation.add_time("render.total", summary["elapsed"])
+    instrumentation.flush("render")
+
+    print(
+        f"Convertidos {summary['succeeded']}/{summary['total']} archivos de {folder} "
+        f"en {summary['elapsed']:.1f}s ({summary['skipped']} al día, "
+        f"{len(summary['failed'])} fallidos)"
+    )
+    return summary
+
+
+def test_corpus_alignment(progression="ii,7-V,7-I,maj7", tempo=120, sample=4,
+                          sample_rate=DEFAULT_SAMPLE_RATE):
+    """
+    Genera y renderiza (backend 'synth') unas pocas voces a un tempo distinto
+    de 60 y comprueba que cada acorde del corpus cae dentro de su audio y no
+    está vacío (las duraciones de metadata.npz van en pulsos).
+    """
+    global WAV_DIR
+    import tempfile
+    from .corpus import AudioCorpus
+    from .generate_progression import generate_progression
+
+    saved = WAV_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        tmp = Path(tmp)
+        WAV_DIR = tmp / "wav"
+        try:
+            generate_progression(progression, "corpus", tmp / "mid", tempo=tempo, seed=0, sample=sample)
+            convert_all_mid_in_folder(tmp / "mid" / "corpus", sample_rate, max_workers=1, backend="synth",
+                                      incremental=False, corpus_dir=tmp / "corpus",
+                                      roman_sequence=progression.split("-"))
+        finally:
+            WAV_DIR = saved
+        corpus = AudioCorpus(tmp / "corpus")
+        assert len(corpus) == sample, len(corpus)
+        for i in range(len(corpus)):
+            length = len(corpus[i])
+            for start, end, label in corpus.chords(i):
+                if not start < end <= length:
+                    raise ValueError(f"[test_corpus_alignment] Acorde {label} de {corpus.ids[i]} "
+                                     f"fuera del audio: ({start}, {end}) con {length} muestras")
+    print(f"corpus a {tempo} BPM: {sample} muestras con los acordes dentro del audio")
+
+
+if __name__ == "__main__":
+    test_corpus_alignment()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+
+"""
+Módulo: benchmark
+-----------------
+Suite de benchmarks de las etapas generar / renderizar / anotar. Cada caso se
+ejecuta en un proceso nuevo (para que el pico de memoria sea el del caso) sobre
+una carpeta temporal, y se mide:
+
+- tiempo de pared de la etapa y archivos (o llamadas) por segundo,
+- pico de memoria residente (RSS) del proceso y de sus hijos,
+- bytes escritos en la carpeta de salida de la etapa.
+
+Los resultados se guardan en JSON (uno por ejecución, con el commit actual)
+para comparar entre commits con `compare_results`. Funciona sin red; los casos
+de timidity se omiten si el binario no está instalado.
+
+Uso:
+    python -m src.benchmark                       # guarda en data/benchmarks/
+    python -m src.benchmark --compare viejo.json  # y compara con otra ejecución
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .config import DATA_DIR, DEFAULT_MAX_WORKERS, DEFAULT_SAMPLE_RATE
+
+BENCHMARK_DIR = DATA_DIR / "benchmarks"
+
+PROGRESSION_3 = ("ii,7-V,7-I,maj7", "bench3", ["ii,7", "V,7", "I,maj7"])
+PROGRESSION_4 = ("ii,7-V,7-I,maj7-vi,min", "bench4", ["ii,7", "V,7", "I,maj7", "vi,min"])
+MIDI_TO_WAV_SAMPLE = 32      # archivos para el caso midi_to_wav (uno a uno)
+ROMAN_LABEL_REPEATS = 200    # pasadas sobre numerales x tonalidades en roman_to_chord_label
+
+
+def _dir_size(folder: Path) -> int:
+    if not folder.exists():
+        return 0
+    return sum(f.stat().st_size for f in folder.rglob("*") if f.is_file())
+
+
+def _redirect_outputs(workdir: Path, stage: str):
+    """
+    Las etapas escriben en WAV_DIR / JAMS_DIR de config.py; en el proceso del
+    caso se redirigen a la carpeta temporal para no tocar data/. Solo se
+    importa el módulo de la etapa, para no sumar su memoria a otros casos.
+    """
+    if stage == "render":
+        from . import audio_conversion
+        audio_conversion.WAV_DIR = workdir / "wav"
+    elif stage == "annotate":
+        from . import jams_creation
+        jams_creation.JAMS_DIR = workdir / "jams"
+
+
+def _case_generate(workdir: Path, spec: tuple, workers: int):
+    from .generate_progression import generate_progression
+    progression, name, _ = spec
+    generate_progression(progression, name, output_dir=workdir / "midi", seed=0,
+                         max_workers=workers, incremental=False)
+    output = workdir / "midi" / name
+    return len(list(output.glob("*.mid"))), output
+
+
+def _case_midi_to_wav(workdir: Path, backend: str):
+    from .audio_conversion import midi_to_wav
+    mid_files = sorted((workdir / "midi" / PROGRESSION_3[1]).glob("*.mid"))[:MIDI_TO_WAV_SAMPLE]
+    for mf in mid_files:
+        midi_to_wav(mf, DEFAULT_SAMPLE_RATE, backend=backend)
+    return len(mid_files), workdir / "wav"
+
+
+def _case_convert(workdir: Path, backend: str, workers: int):
+    from .audio_conversion import convert_all_mid_in_folder
+    summary = convert_all_mid_in_folder(workdir / "midi" / PROGRESSION_3[1], DEFAULT_SAMPLE_RATE,
+                                        max_workers=workers, backend=backend, incremental=False)
+    return summary["succeeded"], workdir / "wav"
+
+
+def _case_jams(workdir: Path, batch: bool):
+    from .jams_creation import create_jams_for_folder
+    folder = workdir / "midi" / PROGRESSION_3[1]
+    create_jams_for_folder(folder, PROGRESSION_3[2], progression_name=PROGRESSION_3[1],
+                           incremental=False, batch=batch)
+    return len(list(folder.glob("*.mid"))), workdir / "jams"
+
+
+def _case_roman_labels(workdir: Path):
+    from .roman_to_chord import roman_to_chord_label
+    numerals = ["I", "ii,7", "iii,min", "IV,maj7", "V,7", "vi,min7", "vii,hdim7",
+                "i,min", "vii,dim", "V,sus4", "IV,aug", "ii,dim"]
+    keys = ["C", "G", "D", "A", "E", "B", "F#", "F", "Bb", "Eb", "Ab", "Db",
+            "Am", "Em", "Bm", "Dm", "Gm", "Cm"]
+    calls = 0
+    for _ in range(ROMAN_LABEL_REPEATS):
+        for key in keys:
+            for numeral in numerals:
+                roman_to_chord_label(numeral, key)
+                calls += 1
+    return calls, None
+
+
+def benchmark_cases(workers: int) -> list:
+    """
+    Lista de casos en orden de ejecución: (nombre, etapa, unidad, función,
+    argumentos, motivo para omitirlo o None). Los casos de render y anotación
+    usan la carpeta que genera 'generate_3chords'.
+    """
+    no_timidity = None if shutil.which("timidity") else "timidity no está instalado"
+    return [
+        ("generate_3chords", "generate", "files", _case_generate, (PROGRESSION_3, workers), None),
+        ("generate_4chords", "generate", "files", _case_generate, (PROGRESSION_4, workers), None),
+        ("midi_to_wav_synth", "render", "files", _case_midi_to_wav, ("synth",), None),
+        ("midi_to_wav_timidity", "render", "files", _case_midi_to_wav, ("timidity",), no_timidity),
+        ("convert_folder_synth", "render", "files", _case_convert, ("synth", workers), None),
+        ("convert_folder_timidity", "render", "files", _case_convert, ("timidity", workers), no_timidity),
+        ("create_jams_for_folder", "annotate", "files", _case_jams, (False,), None),
+        ("create_jams_for_folder_batch", "annotate", "files", _case_jams, (True,), None),
+        ("roman_to_chord_label", "parse", "calls", _case_roman_labels, (), None),
+    ]
+
+
+def _run_case(func, args, workdir: Path, stage: str) -> dict:
+    """
+    Ejecuta un caso (en su propio proceso) y retorna sus mediciones.
+    """
+    _redirect_outputs(workdir, stage)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        # Se miden los bytes nuevos: la salida se vacía antes de cada caso
+        for folder in ("wav", "jams"):
+            shutil.rmtree(workdir / folder, ignore_errors=True)
+        start = time.perf_counter()
+        items, output = func(workdir, *args)
+        seconds = time.perf_counter() - start
+    # ru_maxrss está en KiB en Linux
+    peak_rss_kb = max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+    return {
+        "items": items,
+        "seconds": round(seconds, 4),
+        "items_per_sec": round(items / seconds, 2) if seconds > 0 else None,
+        "peak_rss_kb": peak_rss_kb,
+        "bytes_written": _dir_size(output) if output is not None else 0,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=Path(__file__).resolve().parent)
+    except OSError:
+        return None
+    return result.stdout.strip() or None
+
+
+def run_benchmarks(output_path: Path = None, workers: int = DEFAULT_MAX_WORKERS, only: list = None) -> dict:
+    """
+    Ejecuta la suite y guarda los resultados en JSON.
+
+    :param output_path: Archivo de resultados. Por defecto
+                        data/benchmarks/bench-<commit>-<fecha>.json.
+    :param workers: max_workers para generación y conversión.
+    :param only: Nombres de casos a ejecutar (None = todos). Los casos de render
+                 y anotación necesitan también 'generate_3chords'.
+    :return: Diccionario con el entorno y la lista de resultados por caso.
+    """
+    commit = _git_commit()
+    results = {
+        "commit": commit,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "workers": workers,
+        "cases": [],
+    }
+    with tempfile.TemporaryDirectory(prefix="chord-bench-") as tmp:
+        workdir = Path(tmp)
+        for name, stage, unit, func, args, skip in benchmark_cases(workers):
+            if only is not None and name not in only:
+                continue
+            case = {"name": name, "stage": stage, "unit": unit}
+            if skip is not None:
+                case["skipped"] = skip
+                print(f"[benchmark] {name}: omitido ({skip})")
+            else:
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    case.update(pool.submit(_run_case, func, args, workdir, stage).result())
+                print(f"[benchmark] {name}: {case['items']} {unit} en {case['seconds']:.2f}s "
+                      f"({case['items_per_sec']} {unit}/s, pico RSS {case['peak_rss_kb'] / 1024:.0f} MiB, "
+                      f"{case['bytes_written'] / 1e6:.1f} MB escritos)")
+            results["cases"].append(case)
+
+    if output_path is None:
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        output_path = BENCHMARK_DIR / f"bench-{commit or 'nogit'}-{stamp}.json"
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"[benchmark] Resultados en {output_path}")
+    return results
+
+
+def compare_results(baseline, current) -> list:
+    """
+    Compara dos ejecuciones (rutas a JSON o diccionarios de run_benchmarks) e
+    imprime, por caso, la razón de velocidad y de pico de memoria.
+
+    :return: Lista de (caso, velocidad actual / base, RSS actual / base).
+    """
+    runs = []
+    for run in (baseline, current):
+        if not isinstance(run, dict):
+            with open(run, "r") as f:
+                run = json.load(f)
+        runs.append({case["name"]: case for case in run["cases"] if "skipped" not in case})
+    base, new = runs
+
+    rows = []
+    for name, case in new.items():
+        if name not in base:
+            continue
+        speed = case["items_per_sec"] / base[name]["items_per_sec"]
+        memory = case["peak_rss_kb"] / base[name]["peak_rss_kb"]
+        rows.append((name, speed, memory))
+        print(f"{name:32s} velocidad x{speed:.2f}   pico RSS x{memory:.2f}")
+    return rows
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Benchmarks de generar / renderizar / anotar")
+    parser.add_argument("--output", type=Path, default=None, help="Archivo JSON de resultados")
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--only", nargs="+", default=None, help="Casos a ejecutar")
+    parser.add_argument("--compare", type=Path, default=None, help="JSON de una ejecución anterior")
+    cli = parser.parse_args()
+
+    current = run_benchmarks(cli.output, cli.workers, cli.only)
+    if cli.compare is not None:
+        compare_results(cli.compare, current)
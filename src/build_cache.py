@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+"""
+Módulo: build_cache
+-------------------
+Manifiesto de construcción incremental. Cada carpeta de salida guarda un
+`manifest.json` con un hash del contenido de entrada de cada artefacto
+(.mid, .wav, .jams). Si el hash no cambió y el archivo existe, el artefacto
+está al día y no se vuelve a construir.
+
+Cada registro se añade además, en el momento, a un diario (`journal.jsonl`)
+que `save` compacta en el manifiesto: si el proceso muere a mitad de una
+carpeta, al relanzarlo se omiten los archivos ya terminados. El diario guarda
+también los fallos (con el mensaje del backend) para reintentar solo esos.
+Los artefactos se escriben en un temporal y se renombran (`os.replace`), así
+que nunca queda un archivo a medias con el nombre final.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+MANIFEST_NAME = "manifest.json"
+JOURNAL_NAME = "journal.jsonl"
+
+
+def artifact_hash(**fields) -> str:
+    """
+    Hash estable de los parámetros que determinan un artefacto
+    (progresión, tónica, inversiones, semilla, tempo, sample rate, backend...).
+    """
+    payload = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def file_hash(path: Path) -> str:
+    """
+    Hash del contenido de un archivo (para artefactos derivados de otro archivo).
+    """
+    return hashlib.sha1(Path(path).read_bytes()).hexdigest()
+
+
+def temp_path(path: Path) -> Path:
+    """
+    Ruta temporal junto a `path` (mismo sistema de archivos, para os.replace).
+    """
+    path = Path(path)
+    return path.with_name(f"{path.name}.{os.getpid()}.tmp")
+
+
+def atomic_write(path: Path, data):
+    """
+    Escribe bytes o texto en `path` de forma atómica (temporal + os.replace).
+    """
+    path = Path(path)
+    tmp_path = temp_path(path)
+    try:
+        if isinstance(data, str):
+            tmp_path.write_text(data, encoding="utf-8")
+        else:
+            tmp_path.write_bytes(data)
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+
+class BuildManifest:
+    """
+    Registro {nombre de artefacto: hash} de una carpeta de salida, más los
+    fallos pendientes {nombre: {'digest', 'code', 'error'}} en `failures`.
+
+    :param folder: Carpeta cuyos artefactos se registran; el manifiesto se
+                   guarda en folder / MANIFEST_NAME y el diario en folder / JOURNAL_NAME.
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        self.path = self.folder / MANIFEST_NAME
+        self.journal_path = self.folder / JOURNAL_NAME
+        self.entries = {}
+        self.failures = {}
+        self._journal = None
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                self.entries = json.load(f)
+        if self.journal_path.exists():
+            with open(self.journal_path, "r") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # línea cortada por una interrupción
+                    if "error" in record:
+                        self.failures[record["name"]] = {
+                            "digest": record["digest"], "code": record["code"], "error": record["error"]
+                        }
+                    else:
+                        self.entries[record["name"]] = record["digest"]
+                        self.failures.pop(record["name"], None)
+
+    def is_fresh(self, name: str, digest: str) -> bool:
+        """
+        True si el artefacto existe y fue construido con el mismo hash.
+        """
+        return self.entries.get(name) == digest and (self.folder / name).exists()
+
+    def _append(self, record: dict):
+        if self._journal is None:
+            self.folder.mkdir(parents=True, exist_ok=True)
+            self._journal = open(self.journal_path, "a")
+        self._journal.write(json.dumps(record) + "\n")
+        self._journal.flush()
+
+    def record(self, name: str, digest: str):
+        self.entries[name] = digest
+        self.failures.pop(name, None)
+        self._append({"name": name, "digest": digest})
+
+    def record_failure(self, name: str, digest: str, code: int, error: str = ""):
+        """
+        Registra un artefacto que no se pudo construir (código de salida y
+        mensaje, ej. el stderr de timidity).
+        """
+        self.entries.pop(name, None)
+        self.failures[name] = {"digest": digest, "code": code, "error": error}
+        self._append({"name": name, "digest": digest, "code": code, "error": error})
+
+    def save(self):
+        """
+        Guarda el manifiesto y deja en el diario solo los fallos pendientes.
+        """
+        self.folder.mkdir(parents=True, exist_ok=True)
+        atomic_write(self.path, json.dumps(self.entries))
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if self.failures:
+            atomic_write(self.journal_path, "".join(
+                json.dumps({"name": name, **failure}) + "\n" for name, failure in self.failures.items()
+            ))
+        else:
+            self.journal_path.unlink(missing_ok=True)
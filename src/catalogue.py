@@ -0,0 +1,362 @@
+#!/usr/bin/env python
+
+"""
+Módulo: catalogue
+-----------------
+Ejecución de un catálogo de progresiones (lista o archivo de especificación)
+con un solo pool de procesos compartido por todas las etapas.
+
+Cada progresión se divide en tareas: generar (una), renderizar y anotar (una
+por bloque de `chunk_size` archivos, que dependen solo de la generación). Las
+tareas listas se ordenan por prioridad: primero render y anotación de las
+progresiones más antiguas y, cuando no hay, la generación de la siguiente,
+de modo que el generador y el render se solapan y todos los núcleos trabajan.
+
+El proceso principal es el único que escribe los manifiestos de WAV_DIR y
+JAMS_DIR y un checkpoint (JSON) con las tareas terminadas: si la ejecución se
+interrumpe, al relanzarla continúa donde se quedó.
+
+Formato del catálogo (JSON o JSONL), una entrada por progresión:
+    "ii,7-V,7-I,maj7"
+    {"progression": "ii,7-V,7-I,maj7", "name": "ii7-V7-Imaj7", "seed": 1,
+     "roman_sequence": ["ii,7", "V,7", "I,maj7"], "sample": 300}
+Claves opcionales: name, roman_sequence, seed, tempo, roots, octaves,
+inversions, sample y max_voicings (ver generate_progression).
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from pathlib import Path
+
+from .config import (
+    MIDI_DIR, WAV_DIR, JAMS_DIR, DEFAULT_TEMPO, DEFAULT_SAMPLE_RATE,
+    DEFAULT_MAX_WORKERS, DEFAULT_RENDER_BACKEND
+)
+from .build_cache import BuildManifest, artifact_hash
+from .chord_theory import THEORY_VERSION
+from .generate_progression import generate_progression, progression_name, resolve_seed
+from .audio_conversion import render_files, wav_digest
+from .jams_creation import jams_digest, write_jams_files
+from .metadata import MetadataIndex
+from .layout import artifact_relpath
+
+CHECKPOINT_NAME = "catalogue_checkpoint.json"
+DEFAULT_CHUNK_SIZE = 64
+CHECKPOINT_INTERVAL = 5.0  # segundos mínimos entre checkpoints
+GENERATION_KEYS = ("tempo", "roots", "octaves", "inversions", "sample", "max_voicings")
+# Menor = antes. Render y anotación van antes que generar más progresiones
+_STAGE_PRIORITY = {"render": 0, "jams": 0, "generate": 1}
+
+
+def _normalize_entry(entry) -> dict:
+    if isinstance(entry, str):
+        entry = {"progression": entry}
+    if "progression" not in entry:
+        raise ValueError(f"[catalogue] Entrada sin 'progression': {entry}")
+    spec = dict(entry)
+    spec.setdefault("name", progression_name(spec["progression"]))
+    spec.setdefault("roman_sequence", spec["progression"].split("-"))
+    if spec.get("roots") is not None:
+        # En JSON los pares (nota, octava) llegan como listas
+        spec["roots"] = [tuple(root) if isinstance(root, list) else root for root in spec["roots"]]
+    return spec
+
+
+def load_catalogue(path: Path) -> list:
+    """
+    Lee un catálogo: un JSON con una lista de entradas, o un JSONL con una
+    entrada por línea (ver el formato en la cabecera del módulo).
+    """
+    path = Path(path)
+    with open(path, "r") as f:
+        if path.suffix == ".jsonl":
+            return [json.loads(line) for line in f if line.strip()]
+        return json.load(f)
+
+
+def _load_checkpoint(path: Path) -> dict:
+    if not path.exists():
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def _save_checkpoint(path: Path, progress: dict):
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(progress, f)
+    os.replace(tmp_path, path)
+
+
+def _generate_task(spec: dict, output_dir: Path, seed: int):
+    options = {key: spec[key] for key in GENERATION_KEYS if key in spec}
+    options.setdefault("tempo", DEFAULT_TEMPO)
+    generate_progression(spec["progression"], spec["name"], output_dir, seed=seed, **options)
+
+
+def run_catalogue(
+    catalogue: list,
+    output_dir: Path = MIDI_DIR,
+    sample_rate: int = DEFAULT_SAMPLE_RATE,
+    backend: str = DEFAULT_RENDER_BACKEND,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    render: bool = True,
+    annotate: bool = True,
+    checkpoint_path: Path = None,
+    resume: bool = True
+) -> dict:
+    """
+    Genera, renderiza y anota todas las progresiones del catálogo en un pool
+    compartido de `max_workers` procesos.
+
+    :param catalogue: Lista de entradas (ver cabecera del módulo) o ruta a un
+                      archivo de catálogo.
+    :param output_dir: Carpeta base de los .mid (una subcarpeta por progresión).
+    :param sample_rate: Frecuencia de muestreo del render.
+    :param backend: Backend de render ('timidity' o 'synth').
+    :param max_workers: Procesos del pool (tareas simultáneas).
+    :param chunk_size: Archivos por tarea de render / anotación.
+    :param render: Si es False, no se renderiza.
+    :param annotate: Si es False, no se crean .jams.
+    :param checkpoint_path: Archivo de checkpoint (por defecto output_dir/catalogue_checkpoint.json).
+    :param resume: Si es True, se omiten las tareas que el checkpoint da por
+                   terminadas (para la misma especificación).
+    :return: Resumen con 'progressions', 'generated', 'rendered', 'annotated',
+             'skipped' (archivos al día), 'failed' (lista de (progresión, etapa,
+             detalle)) y 'elapsed' (segundos).
+    """
+    if isinstance(catalogue, (str, Path)):
+        catalogue = load_catalogue(catalogue)
+    specs = [_normalize_entry(entry) for entry in catalogue]
+    names = [spec["name"] for spec in specs]
+    if len(set(names)) != len(names):
+        raise ValueError("[catalogue] Hay nombres de progresión repetidos en el catálogo")
+
+    start = time.perf_counter()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    checkpoint_path = Path(checkpoint_path) if checkpoint_path else output_dir / CHECKPOINT_NAME
+    saved = _load_checkpoint(checkpoint_path) if resume else {}
+
+    # Estado por progresión; la semilla se fija aquí para que al reanudar sea la misma
+    progress = {}
+    for spec in specs:
+        digest = artifact_hash(
+            kind="catalogue", sample_rate=sample_rate, backend=backend, chunk_size=chunk_size,
+            theory=THEORY_VERSION,
+            **{key: value for key, value in spec.items() if key != "seed"}
+        )
+        entry = saved.get(spec["name"])
+        if entry is None or entry["digest"] != digest or spec.get("seed", entry["seed"]) != entry["seed"]:
+            entry = {"digest": digest, "seed": resolve_seed(spec.get("seed")),
+                     "generated": False, "rendered": [], "annotated": []}
+        progress[spec["name"]] = entry
+
+    manifests = {"render": BuildManifest(WAV_DIR), "jams": BuildManifest(JAMS_DIR)}
+    summary = {"progressions": len(specs), "generated": 0, "rendered": 0, "annotated": 0,
+               "skipped": 0, "failed": [], "elapsed": 0.0}
+    totals = {"generate": len(specs), "render": 0, "jams": 0}
+    finished = {"generate": 0, "render": 0, "jams": 0}
+    ready = []
+    order = itertools.count()
+
+    def push(kind, i, chunk=None, files=None):
+        heapq.heappush(ready, (_STAGE_PRIORITY[kind], i, next(order), kind, chunk, files))
+
+    def schedule_downstream(i):
+        """
+        Encola render y anotación de una progresión ya generada, por bloques,
+        sin los bloques terminados ni los archivos al día.
+        """
+        spec = specs[i]
+        entry = progress[spec["name"]]
+        folder = output_dir / spec["name"]
+        index = MetadataIndex(folder)
+        files = [str(filename) for filename in index.filenames]
+
+        def relpath(name, suffix):
+            row = index.row(name)
+            return artifact_relpath(spec["name"], name, index.key(row), int(index.octave[row]), suffix).as_posix()
+
+        for chunk, lo in enumerate(range(0, len(files), chunk_size)):
+            chunk_files = files[lo:lo + chunk_size]
+            if render:
+                totals["render"] += 1
+                pending = []
+                if chunk not in entry["rendered"]:
+                    pending = [
+                        name for name in chunk_files
+                        if not manifests["render"].is_fresh(
+                            relpath(name, ".wav"), wav_digest(folder / name, sample_rate, backend))
+                    ]
+                summary["skipped"] += len(chunk_files) - len(pending)
+                if pending:
+                    push("render", i, chunk, pending)
+                else:
+                    finished["render"] += 1
+                    if chunk not in entry["rendered"]:
+                        entry["rendered"].append(chunk)
+            if annotate:
+                totals["jams"] += 1
+                pending = []
+                if chunk not in entry["annotated"]:
+                    for name in chunk_files:
+                        row = index.row(name)
+                        digest = jams_digest(spec["roman_sequence"], index.key(row), spec["name"],
+                                             index.durations[row].tolist())
+                        if not manifests["jams"].is_fresh(relpath(name, ".jams"), digest):
+                            pending.append(name)
+                summary["skipped"] += len(chunk_files) - len(pending)
+                if pending:
+                    push("jams", i, chunk, pending)
+                else:
+                    finished["jams"] += 1
+                    if chunk not in entry["annotated"]:
+                        entry["annotated"].append(chunk)
+
+    def submit(pool, task):
+        _, i, _, kind, _, files = task
+        spec = specs[i]
+        folder = output_dir / spec["name"]
+        if kind == "generate":
+            return pool.submit(_generate_task, spec, output_dir, progress[spec["name"]]["seed"])
+        if kind == "render":
+            return pool.submit(render_files, [folder / name for name in files], sample_rate, backend)
+        return pool.submit(write_jams_files, folder, files, spec["roman_sequence"],
+                           progression_name=spec["name"])
+
+    def checkpoint():
+        for manifest in manifests.values():
+            manifest.save()
+        _save_checkpoint(checkpoint_path, progress)
+
+    for i, spec in enumerate(specs):
+        if progress[spec["name"]]["generated"] and MetadataIndex.exists(output_dir / spec["name"]):
+            finished["generate"] += 1
+            schedule_downstream(i)
+        else:
+            progress[spec["name"]]["generated"] = False
+            push("generate", i)
+
+    running = {}
+    last_checkpoint = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        while ready or running:
+            # Solo max_workers tareas en vuelo, para que el orden de prioridad cuente
+            while ready and len(running) < max(1, max_workers):
+                task = heapq.heappop(ready)
+                running[submit(pool, task)] = task
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                _, i, _, kind, chunk, files = running.pop(future)
+                name = specs[i]["name"]
+                entry = progress[name]
+                finished[kind] += 1
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    summary["failed"].append((name, kind, repr(exc)))
+                    print(f"[catalogue] Falló {kind} de {name}: {exc!r}")
+                    continue
+
+                if kind == "generate":
+                    entry["generated"] = True
+                    summary["generated"] += 1
+                    schedule_downstream(i)
+                elif kind == "render":
+                    chunk_failed = False
+                    for mf, wav_name, digest, code, error in result:
+                        if code == 0:
+                            manifests["render"].record(wav_name, digest)
+                            summary["rendered"] += 1
+                        else:
+                            chunk_failed = True
+                            manifests["render"].record_failure(wav_name, digest, code, error)
+                            summary["failed"].append((name, kind, f"{Path(mf).name} (código {code})"))
+                    # Un bloque con fallos se reintenta al reanudar
+                    if not chunk_failed:
+                        entry["rendered"].append(chunk)
+                else:
+                    for jam_name, digest in result:
+                        manifests["jams"].record(jam_name, digest)
+                    summary["annotated"] += len(result)
+                    entry["annotated"].append(chunk)
+
+                print(
+                    f"[catalogue] {kind} {name} listo | generate {finished['generate']}/{totals['generate']}, "
+                    f"render {finished['render']}/{totals['render']}, jams {finished['jams']}/{totals['jams']} "
+                    f"bloques | {time.perf_counter() - start:.0f}s"
+                )
+
+            if time.perf_counter() - last_checkpoint >= CHECKPOINT_INTERVAL:
+                checkpoint()
+                last_checkpoint = time.perf_counter()
+    checkpoint()
+
+    summary["elapsed"] = time.perf_counter() - start
+    print(
+        f"Catálogo de {summary['progressions']} progresiones en {summary['elapsed']:.1f}s: "
+        f"{summary['generated']} generadas, {summary['rendered']} .wav, {summary['annotated']} .jams "
+        f"({summary['skipped']} al día, {len(summary['failed'])} fallos)"
+    )
+    return summary
+
+
+def test_catalogue(progression="V,7/V-V,7-I,maj7", sample=16):
+    """
+    Ejecuta (sin render ni anotación) un catálogo con una dominante secundaria:
+    el nombre por defecto no debe contener '/' y los .mid deben existir.
+    """
+    global WAV_DIR, JAMS_DIR
+    import tempfile
+    saved = WAV_DIR, JAMS_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        output_dir = Path(tmp)
+        # Los manifiestos también van al temporal, no a los de config.py
+        WAV_DIR, JAMS_DIR = output_dir / "wav", output_dir / "jams"
+        try:
+            summary = run_catalogue([{"progression": progression, "seed": 0, "sample": sample}],
+                                    output_dir, max_workers=1, render=False, annotate=False)
+        finally:
+            WAV_DIR, JAMS_DIR = saved
+        name = _normalize_entry(progression)["name"]
+        assert "/" not in name and os.sep not in name, name
+        assert not summary["failed"], summary["failed"]
+        mids = sorted((output_dir / name).glob("*.mid"))
+        assert len(mids) == sample, (name, len(mids))
+        assert all(mid.parent == output_dir / name for mid in mids)
+        try:
+            generate_progression(progression, "V7/V-V7-Imaj7", output_dir, sample=1)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("generate_progression aceptó un nombre con '/'")
+    print(f"catálogo con '{progression}' -> {name}: {len(mids)} archivos")
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Genera, renderiza y anota un catálogo de progresiones")
+    parser.add_argument("catalogue", type=Path, nargs="?",
+                        help="Archivo de catálogo (JSON o JSONL); sin él se ejecuta test_catalogue")
+    parser.add_argument("--output-dir", type=Path, default=MIDI_DIR)
+    parser.add_argument("--backend", default=DEFAULT_RENDER_BACKEND)
+    parser.add_argument("--sample-rate", type=int, default=DEFAULT_SAMPLE_RATE)
+    parser.add_argument("--workers", type=int, default=DEFAULT_MAX_WORKERS)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--no-render", action="store_true")
+    parser.add_argument("--no-jams", action="store_true")
+    parser.add_argument("--restart", action="store_true", help="Ignora el checkpoint existente")
+    cli = parser.parse_args()
+
+    if cli.catalogue is None:
+        test_catalogue()
+        raise SystemExit
+    run_catalogue(cli.catalogue, cli.output_dir, cli.sample_rate, cli.backend, cli.workers,
+                  cli.chunk_size, not cli.no_render, not cli.no_jams, resume=not cli.restart)
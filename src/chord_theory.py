@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+
+"""
+Módulo: chord_theory
+--------------------
+Teoría de acordes compartida por la generación (notas MIDI) y la anotación
+(etiquetas JAMS). Un numeral romano ('ii,7', 'IV,#,maj7', 'V7', 'bVII') se
+analiza una sola vez en un `Chord` inmutable, y de él salen tanto las notas
+de cada inversión como la etiqueta en cualquier tonalidad, con las mismas
+tablas:
+
+- SCALES: semitonos desde la tónica de cada grado de la escala (mayor, menor,
+  modos y menores armónica y melódica). DEGREE_TABLE los precalcula para las
+  12 tónicas.
+- QUALITIES: intervalos de cada calidad, de cualquier número de notas
+  (triadas, cuatríadas, novenas, oncenas, trecenas y dominantes alteradas).
+  QUALITY_LABELS da su etiqueta JAMS (Harte) cuando no coincide con el nombre.
+
+Notación de los numerales:
+- Mayúscula / minúscula: triada mayor / menor si no hay sufijo. Con sufijo '7',
+  dominante en mayúscula y menor séptima en minúscula ('V,7' = G:7, 'ii,7' = D:min7);
+  lo mismo con '9', '11' y '13' ('ii,9' = D:min9).
+- Alteración: prefijo ('bVII', '#iv') o token tras la coma ('IV,#,maj7').
+- Sufijo: tras una coma ('ii,min7') o pegado al numeral ('V7', 'iimin7').
+- Dominantes secundarias: '/grado' toma como tónica ese grado ('V/V', 'V,7/ii',
+  'vii,dim7/V'), en mayor si está en mayúscula y en menor armónica si no.
+"""
+
+import re
+from functools import lru_cache
+
+# Versión de la teoría: entra en los hashes de los .mid, .jams y del catálogo
+# (ver build_cache.artifact_hash). Hay que subirla cuando cambien las notas o
+# las etiquetas de numerales ya existentes, para que las construcciones
+# incrementales no den por buenos los artefactos anteriores.
+THEORY_VERSION = 2
+
+# Nombres de las clases de altura en las etiquetas (con sostenidos)
+PITCH_NAMES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+
+SCALES = {
+    "major": (0, 2, 4, 5, 7, 9, 11),  # I, II, III, IV, V, VI, VII (jónico)
+    "minor": (0, 2, 3, 5, 7, 8, 10),  # i, ii°, III, iv, v, VI, VII (eólico)
+    "dorian": (0, 2, 3, 5, 7, 9, 10),
+    "phrygian": (0, 1, 3, 5, 7, 8, 10),
+    "lydian": (0, 2, 4, 6, 7, 9, 11),
+    "mixolydian": (0, 2, 4, 5, 7, 9, 10),
+    "locrian": (0, 1, 3, 5, 6, 8, 10),
+    "harmonic_minor": (0, 2, 3, 5, 7, 8, 11),
+    "melodic_minor": (0, 2, 3, 5, 7, 9, 11),
+}
+
+MODES = tuple(SCALES)
+MODE_INDEX = {mode: m for m, mode in enumerate(MODES)}
+
+# DEGREE_TABLE[tónica][modo][grado] -> clase de altura (0..11) de ese grado,
+# precalculada al importar para las 12 tónicas y todos los modos (en el orden
+# de MODES); Chord.root la lee en vez de sumar y reducir en cada etiqueta
+DEGREE_TABLE = tuple(
+    tuple(tuple((root + step) % 12 for step in SCALES[mode]) for mode in MODES)
+    for root in range(12)
+)
+
+# Escala de la tónica temporal de una dominante secundaria ('V/ii'), según el
+# caso del grado: la menor armónica da la sensible (vii°/ii = C#:dim en C)
+TONICIZATION_SCALES = {True: "major", False: "harmonic_minor"}
+
+# Calidad JAMS -> intervalos desde la raíz del acorde
+QUALITIES = {
+    "min": (0, 3, 7),
+    "maj": (0, 4, 7),
+    "dim": (0, 3, 6),
+    "aug": (0, 4, 8),
+    "min6": (0, 3, 7, 9),
+    "maj6": (0, 4, 7, 9),
+    "min7": (0, 3, 7, 10),
+    "minmaj7": (0, 3, 7, 11),
+    "maj7": (0, 4, 7, 11),
+    "7": (0, 4, 7, 10),
+    "dim7": (0, 3, 6, 9),
+    "hdim7": (0, 3, 6, 10),
+    "sus2": (0, 2, 7),
+    "sus4": (0, 5, 7),
+    "9": (0, 4, 7, 10, 14),
+    "maj9": (0, 4, 7, 11, 14),
+    "min9": (0, 3, 7, 10, 14),
+    "11": (0, 4, 7, 10, 14, 17),
+    "min11": (0, 3, 7, 10, 14, 17),
+    "13": (0, 4, 7, 10, 14, 21),  # sin la oncena (choca con la tercera)
+    "maj13": (0, 4, 7, 11, 14, 21),
+    "min13": (0, 3, 7, 10, 14, 21),
+    "7b9": (0, 4, 7, 10, 13),
+    "7#9": (0, 4, 7, 10, 15),
+    "7#11": (0, 4, 7, 10, 18),
+    "7alt": (0, 4, 10, 13, 15, 20),  # b9, #9 y b13, sin quinta
+}
+
+# Etiqueta JAMS de cada calidad: el propio nombre, salvo las que Harte escribe
+# con grados añadidos (+) u omitidos (*) entre paréntesis
+QUALITY_LABELS = {quality: quality for quality in QUALITIES}
+QUALITY_LABELS.update({
+    "13": "13(*11)",
+    "maj13": "maj13(*11)",
+    "min13": "min13(*11)",
+    "7b9": "7(b9)",
+    "7#9": "7(#9)",
+    "7#11": "7(#11)",
+    "7alt": "7(*5,b9,#9,b13)",
+})
+
+# Sufijos que en un numeral en minúscula son la versión menor ('ii,7' = min7)
+MINOR_SUFFIXES = {"7": "min7", "9": "min9", "11": "min11", "13": "min13"}
+
+ROMAN_DEGREES = {"i": 0, "ii": 1, "iii": 2, "iv": 3, "v": 4, "vi": 5, "vii": 6}
+ACCIDENTALS = {"": 0, "b": -1, "#": 1}
+
+
+def _alternation(options) -> str:
+    # Los más largos primero, para no cortar 'iii' en 'i' ni 'maj7' en 'maj'
+    return "|".join(sorted(map(re.escape, options), key=len, reverse=True))
+
+
+_NUMERAL_RE = re.compile(
+    r"(?P<accidental>[b#]?)"
+    r"(?P<degree>(?i:" + _alternation(ROMAN_DEGREES) + r"))\s*"
+    r"(?:,(?P<tokens>.*)|(?P<suffix>(?i:" + _alternation(QUALITIES) + r"))?)",
+    re.DOTALL
+)
+_TARGET_RE = re.compile(
+    r"(?P<accidental>[b#]?)(?P<degree>(?i:" + _alternation(ROMAN_DEGREES) + r"))"
+)
+
+
+class Chord:
+    """
+    Acorde de un numeral romano (inmutable).
+
+    - degree: grado en la escala (0..6).
+    - accidental: alteración de la raíz en semitonos (-1, 0, 1).
+    - upper: si el numeral estaba en mayúscula.
+    - quality: calidad JAMS ('maj', 'min7', '7'...).
+    - intervals: semitonos de cada nota desde la raíz del acorde.
+    - target: en una dominante secundaria ('V/V'), el grado que hace de tónica
+      (otro Chord); None en los demás acordes.
+    """
+    __slots__ = ("degree", "accidental", "upper", "quality", "intervals", "target")
+
+    def __init__(self, degree: int, accidental: int, upper: bool, quality: str, target=None):
+        if quality not in QUALITIES:
+            raise ValueError(
+                f"[chord_theory] Calidad no reconocida: {quality} (opciones: {', '.join(QUALITIES)})"
+            )
+        object.__setattr__(self, "degree", degree)
+        object.__setattr__(self, "accidental", accidental)
+        object.__setattr__(self, "upper", upper)
+        object.__setattr__(self, "quality", quality)
+        object.__setattr__(self, "intervals", QUALITIES[quality])
+        object.__setattr__(self, "target", target)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("[chord_theory] Chord es inmutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("[chord_theory] Chord es inmutable")
+
+    def __reduce__(self):
+        # pickle no puede usar __setattr__: se reconstruye con el constructor
+        return Chord, self._fields()
+
+    def _fields(self) -> tuple:
+        return self.degree, self.accidental, self.upper, self.quality, self.target
+
+    def __eq__(self, other):
+        return isinstance(other, Chord) and self._fields() == other._fields()
+
+    def __hash__(self):
+        return hash(self._fields())
+
+    def __repr__(self):
+        return (f"Chord(degree={self.degree}, accidental={self.accidental}, "
+                f"upper={self.upper}, quality={self.quality!r}"
+                + (f", target={self.target!r})" if self.target is not None else ")"))
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def root_offset(self, scale: str = "major") -> int:
+        """
+        Semitonos de la raíz del acorde desde la tónica de la tonalidad. En una
+        dominante secundaria se cuentan desde la raíz del grado `target` (y se
+        reducen a una octava).
+        """
+        if self.target is not None:
+            return self.root(0, scale)
+        return DEGREE_TABLE[0][MODE_INDEX[scale]][self.degree] + self.accidental
+
+    def root(self, key_root: int = 0, scale: str = "major") -> int:
+        """
+        Clase de altura (0..11) de la raíz del acorde en la tonalidad, leída de
+        DEGREE_TABLE. En una dominante secundaria ('V/V') el grado `target` da
+        la tónica temporal y el acorde se lee en su escala.
+        """
+        if self.target is not None:
+            key_root = self.target.root(key_root, scale)
+            scale = TONICIZATION_SCALES[self.target.upper]
+        return (DEGREE_TABLE[key_root % 12][MODE_INDEX[scale]][self.degree] + self.accidental) % 12
+
+    def pitches(self, inversion: int = 0, scale: str = "major") -> tuple:
+        """
+        Notas del acorde en semitonos desde la tónica, con las `inversion`
+        primeras notas subidas una octava (con tantas inversiones como notas,
+        el acorde entero sube una octava).
+        """
+        offset = self.root_offset(scale)
+        return tuple(
+            offset + interval + (12 if n < inversion else 0)
+            for n, interval in enumerate(self.intervals)
+        )
+
+    def label(self, key_root: int = 0, scale: str = "major") -> str:
+        """
+        Etiqueta JAMS del acorde en la tonalidad (tónica key_root 0..11 y escala).
+        """
+        return f"{PITCH_NAMES[self.root(key_root, scale)]}:{QUALITY_LABELS[self.quality]}"
+
+
+@lru_cache(maxsize=4096)
+def parse_chord(numeral: str) -> Chord:
+    """
+    Analiza un numeral romano con alteración y sufijo opcionales (ver la
+    notación en la cabecera del módulo).
+
+    :param numeral: Ej. 'ii,7', 'IV,#,maj7', 'V7', 'bVII', 'vii,hdim7', 'V,7/ii'.
+    :return: El Chord correspondiente.
+    """
+    chord_part, slash, target_part = numeral.partition("/")
+    target = None
+    if slash:
+        target_match = _TARGET_RE.fullmatch(target_part.strip())
+        if target_match is None:
+            raise ValueError(f"[chord_theory] Grado de tonicización no reconocido: {target_part} en {numeral!r}")
+        target_degree = target_match.group("degree")
+        target_upper = target_degree[0].isupper()
+        target = Chord(ROMAN_DEGREES[target_degree.lower()], ACCIDENTALS[target_match.group("accidental")],
+                       target_upper, "maj" if target_upper else "min")
+
+    match = _NUMERAL_RE.fullmatch(chord_part.strip())
+    if match is None:
+        base_part = numeral.strip().split(",", 1)[0].strip()
+        raise ValueError(f"[chord_theory] Numeral romano no reconocido: {base_part} en {numeral!r}")
+
+    degree = match.group("degree")
+    upper = degree[0].isupper()
+    accidental = match.group("accidental")
+    suffix = (match.group("suffix") or "").lower()
+    if match.group("tokens") is not None:
+        tokens = [token.strip() for token in match.group("tokens").split(",")]
+        if tokens[0] in ("#", "b") and not accidental:
+            accidental = tokens.pop(0)
+        if len(tokens) > 1:
+            raise ValueError(f"[chord_theory] Demasiados tokens en el numeral {numeral!r}")
+        suffix = tokens[0] if tokens else ""
+
+    if not suffix:
+        suffix = "maj" if upper else "min"
+    elif not upper:
+        suffix = MINOR_SUFFIXES.get(suffix, suffix)
+    if suffix not in QUALITIES:
+        raise ValueError(f"[chord_theory] Sufijo no reconocido: {suffix} en {numeral!r}")
+    return Chord(ROMAN_DEGREES[degree.lower()], ACCIDENTALS[accidental], upper, suffix, target)
+
+
+@lru_cache(maxsize=1024)
+def parse_progression(progression: str) -> tuple:
+    """
+    Acordes de una progresión separada por guiones (ej. 'ii,7-V,7-I,maj7'),
+    analizada una sola vez: las notas (Chord.pitches) y las etiquetas
+    (Chord.label) salen de los mismos objetos.
+    """
+    return tuple(parse_chord(numeral) for numeral in progression.split("-"))
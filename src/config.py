@@ -11,3 +11,23 @@ JAMS_DIR = DATA_DIR / 'jams'
 # Ajustes de audio, BPM, etc.
 DEFAULT_TEMPO = 60
 DEFAULT_SAMPLE_RATE = 16000
+
+# Tope de archivos por progresión (ver generate_progression.select_voicings): con
+# 4 inversiones por acorde, una progresión de 8 acordes tiene 4^8 voces por tónica
+MAX_VOICINGS = 100_000
+
+# Paralelismo: número máximo de procesos timidity simultáneos
+DEFAULT_MAX_WORKERS = os.cpu_count() or 1
+
+# Backend de render por defecto: 'timidity' (referencia) o 'synth' (NumPy en proceso)
+DEFAULT_RENDER_BACKEND = "timidity"
+
+# Dataset en shards: carpeta por defecto y tamaño máximo de cada shard (bytes)
+SHARDS_DIR = DATA_DIR / 'shards'
+DEFAULT_SHARD_SIZE = 256 * 1024 * 1024
+
+# Organización de los .wav y .jams en WAV_DIR / JAMS_DIR (ver layout.py):
+#  'flat'   => todos en la misma carpeta (<stem>.wav)
+#  'mirror' => <progresión>/<tónica><octava>/<stem>.wav, como los .mid
+#  'hashed' => <progresión>/<hh>/<stem>.wav, con hh = reparto por hash en 256 carpetas
+OUTPUT_LAYOUT = "flat"
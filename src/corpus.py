@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+
+"""
+Módulo: corpus
+--------------
+Corpus de audio consolidado para entrenamiento: todas las muestras en un solo
+array contiguo (`audio.bin`, int16 o float32) que se abre con np.memmap, más un
+índice de offsets/longitudes y las anotaciones de acordes alineadas a él.
+
+Muchos procesos de carga de datos pueden abrir el mismo corpus y compartir la
+caché de páginas del sistema; cada muestra o segmento de acorde es una vista
+del memmap, sin copias ni decodificación de WAV.
+"""
+
+import json
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from .config import DEFAULT_SAMPLE_RATE
+
+AUDIO_NAME = "audio.bin"
+INDEX_NAME = "index.npz"
+META_NAME = "meta.json"
+CORPUS_DTYPES = ("int16", "float32")
+
+
+class AudioCorpusWriter:
+    """
+    Construye un corpus añadiendo muestras una a una. Es seguro usarlo desde
+    varios hilos; las muestras quedan en el orden en que se añaden.
+
+    :param folder: Carpeta del corpus (se sobrescribe si ya existía).
+    :param sample_rate: Frecuencia de muestreo de todas las muestras.
+    :param dtype: 'int16' (PCM, la mitad de espacio) o 'float32'.
+    """
+
+    def __init__(self, folder: Path, sample_rate: int = DEFAULT_SAMPLE_RATE, dtype: str = "int16"):
+        if dtype not in CORPUS_DTYPES:
+            raise ValueError(f"[AudioCorpusWriter] dtype no soportado: {dtype} (opciones: {CORPUS_DTYPES})")
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.sample_rate = sample_rate
+        self.dtype = dtype
+        self._lock = threading.Lock()
+        self._audio = open(self.folder / AUDIO_NAME, "wb")
+        self._offset = 0
+        self._ids = []
+        self._offsets = []
+        self._lengths = []
+        self._chord_ptr = [0]
+        self._chord_start = []
+        self._chord_end = []
+        self._chord_labels = []
+
+    def add(self, sample_id: str, audio: np.ndarray, chords=()):
+        """
+        Añade una muestra.
+
+        :param sample_id: Identificador (ej. el nombre del .mid sin extensión).
+        :param audio: Buffer mono float en [-1, 1].
+        :param chords: Iterable de (inicio_seg, duración_seg, etiqueta).
+        """
+        if self.dtype == "int16":
+            data = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+        else:
+            data = np.asarray(audio, dtype="<f4")
+        starts, ends, labels = [], [], []
+        for onset, duration, label in chords:
+            start = min(int(round(onset * self.sample_rate)), len(data))
+            starts.append(start)
+            ends.append(min(int(round((onset + duration) * self.sample_rate)), len(data)))
+            labels.append(label)
+
+        with self._lock:
+            self._audio.write(data.tobytes())
+            self._ids.append(sample_id)
+            self._offsets.append(self._offset)
+            self._lengths.append(len(data))
+            self._offset += len(data)
+            self._chord_start.extend(starts)
+            self._chord_end.extend(ends)
+            self._chord_labels.extend(labels)
+            self._chord_ptr.append(len(self._chord_start))
+
+    def close(self):
+        """
+        Cierra el audio y escribe el índice y los metadatos.
+        """
+        with self._lock:
+            self._audio.close()
+            np.savez(
+                self.folder / INDEX_NAME,
+                offsets=np.array(self._offsets, dtype=np.int64),
+                lengths=np.array(self._lengths, dtype=np.int64),
+                chord_ptr=np.array(self._chord_ptr, dtype=np.int64),
+                chord_start=np.array(self._chord_start, dtype=np.int64),
+                chord_end=np.array(self._chord_end, dtype=np.int64),
+                chord_labels=np.array(self._chord_labels, dtype=np.str_),
+            )
+            with open(self.folder / META_NAME, "w") as f:
+                json.dump({
+                    "dtype": self.dtype,
+                    "sample_rate": self.sample_rate,
+                    "ids": self._ids,
+                }, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class AudioCorpus:
+    """
+    Lector de un corpus con acceso aleatorio. Todo lo que retorna son vistas
+    (sin copia) del memmap; con dtype int16 los valores están escalados por 32767.
+
+    :param folder: Carpeta del corpus (la de AudioCorpusWriter).
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        with open(self.folder / META_NAME, "r") as f:
+            meta = json.load(f)
+        self.sample_rate = meta["sample_rate"]
+        self.dtype = meta["dtype"]
+        self.ids = meta["ids"]
+        self._positions = {sample_id: i for i, sample_id in enumerate(self.ids)}
+        with np.load(self.folder / INDEX_NAME) as index:
+            self.offsets = index["offsets"]
+            self.lengths = index["lengths"]
+            self.chord_ptr = index["chord_ptr"]
+            self.chord_start = index["chord_start"]
+            self.chord_end = index["chord_end"]
+            self.chord_labels = index["chord_labels"]
+        audio_path = self.folder / AUDIO_NAME
+        if audio_path.stat().st_size == 0:
+            self.audio = np.zeros(0, dtype=self.dtype)
+        else:
+            self.audio = np.memmap(audio_path, dtype=self.dtype, mode="r")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def position(self, sample) -> int:
+        """
+        Posición de una muestra dada por índice o por id.
+        """
+        if isinstance(sample, str):
+            return self._positions[sample]
+        return int(sample)
+
+    def __getitem__(self, sample) -> np.ndarray:
+        """
+        Audio de una muestra (por índice o id) como vista del memmap.
+        """
+        i = self.position(sample)
+        start = self.offsets[i]
+        return self.audio[start:start + self.lengths[i]]
+
+    def chords(self, sample) -> list:
+        """
+        Anotaciones de una muestra: lista de (inicio, fin, etiqueta), en muestras
+        relativas al inicio de la muestra.
+        """
+        i = self.position(sample)
+        lo, hi = self.chord_ptr[i], self.chord_ptr[i + 1]
+        return [
+            (int(s), int(e), str(label))
+            for s, e, label in zip(self.chord_start[lo:hi], self.chord_end[lo:hi], self.chord_labels[lo:hi])
+        ]
+
+    def chord_segment(self, sample, chord: int) -> np.ndarray:
+        """
+        Audio del acorde número `chord` de una muestra, como vista del memmap.
+        """
+        i = self.position(sample)
+        j = self.chord_ptr[i] + chord
+        if not self.chord_ptr[i] <= j < self.chord_ptr[i + 1]:
+            raise IndexError(f"[AudioCorpus] La muestra {self.ids[i]} no tiene el acorde {chord}")
+        base = self.offsets[i]
+        return self.audio[base + self.chord_start[j]:base + self.chord_end[j]]
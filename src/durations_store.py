@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+
+"""
+Módulo: durations_store
+-----------------------
+Almacén de duraciones en streaming. En lugar de acumular todas las duraciones
+en memoria y volcarlas al final en un durations.json, el generador añade una
+línea `["archivo.mid", [d1, d2, ...]]` a durations.jsonl por cada archivo que
+produce. La lectura es perezosa: al abrir solo se registra el offset de cada
+línea, y cada consulta lee y parsea únicamente la línea pedida.
+
+Las carpetas antiguas con durations.json se siguen pudiendo leer.
+"""
+
+import json
+from pathlib import Path
+
+DURATIONS_NAME = "durations.jsonl"
+LEGACY_DURATIONS_NAME = "durations.json"
+
+
+class DurationsWriter:
+    """
+    Escritor append-only de durations.jsonl.
+
+    :param folder: Carpeta de la progresión; el archivo se crea (vacío) en folder/durations.jsonl.
+    """
+
+    def __init__(self, folder: Path):
+        self.path = Path(folder) / DURATIONS_NAME
+        self._file = open(self.path, "w", encoding="utf-8")
+
+    def add(self, filename: str, durations: list):
+        self._file.write(json.dumps([filename, durations], ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class DurationsStore:
+    """
+    Lector perezoso de las duraciones de una carpeta (durations.jsonl o,
+    si no existe, el durations.json antiguo).
+
+    :param folder: Carpeta de la progresión.
+    """
+
+    def __init__(self, folder: Path):
+        folder = Path(folder)
+        self._offsets = {}
+        self._legacy = None
+        self._file = None
+        jsonl_path = folder / DURATIONS_NAME
+        legacy_path = folder / LEGACY_DURATIONS_NAME
+        if jsonl_path.exists():
+            self._file = open(jsonl_path, "rb")
+            offset = 0
+            decoder = json.JSONDecoder()
+            for line in self._file:
+                # Cada línea empieza por ["<archivo>", ...: basta con leer la clave.
+                # Si el nombre lleva escapes JSON (comillas, barras...), la clave
+                # se decodifica con json en lugar de cortarse en la primera comilla.
+                end = line.index(b'"', 2)
+                key = line[2:end]
+                if b"\\" in key:
+                    key = decoder.raw_decode(line.decode("utf-8"), 1)[0]
+                else:
+                    key = key.decode("utf-8")
+                self._offsets[key] = offset
+                offset += len(line)
+        elif legacy_path.exists():
+            with open(legacy_path, "r") as f:
+                self._legacy = json.load(f)
+
+    def __len__(self):
+        if self._legacy is not None:
+            return len(self._legacy)
+        return len(self._offsets)
+
+    def __contains__(self, filename):
+        if self._legacy is not None:
+            return filename in self._legacy
+        return filename in self._offsets
+
+    def get(self, filename: str, default=None):
+        """
+        Duraciones de un archivo (ej. 'C-2-ii7-V7-I-0.mid'), o `default` si no está.
+        """
+        if self._legacy is not None:
+            return self._legacy.get(filename, default)
+        offset = self._offsets.get(filename)
+        if offset is None:
+            return default
+        self._file.seek(offset)
+        return json.loads(self._file.readline())[1]
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
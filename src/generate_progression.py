@@ -2,221 +2,831 @@
 
 from midiutil import MIDIFile
 from pathlib import Path
-import random
-import json
-from .config import MIDI_DIR
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import itertools
+import os
+import threading
+import time
+import zlib
+import numpy as np
+from .config import MIDI_DIR, MAX_VOICINGS
+from .build_cache import BuildManifest, artifact_hash
+from .shards import ShardWriter
+from .metadata import PAD, save_metadata, voicing_columns
+from .durations_store import DurationsWriter
+from .midi_io import encode_midi
+from .chord_theory import ACCIDENTALS, QUALITIES, THEORY_VERSION, Chord, parse_chord, parse_progression
+from . import instrumentation
 
 NOTE_ARRAY = ["C", "C#", "D", "Eb", "E", "F",
               "F#", "G", "Ab", "A", "Bb", "B"]
 OCTAVE_ARRAY = [2, 3, 4, 5]
 
-ALTERATIONS_ARR = [
-    "min", "maj", "dim", "aug",
-    "min6", "maj6",
-    "min7", "minmaj7", "maj7", "7", "dim7", "hdim7",
-    "sus2", "sus4"
-]
-
-def baseChords(firstNote, numeral):
-    if numeral.isupper():
-        note1 = firstNote
-        note2 = note1 + 4
-        note3 = note2 + 3
-    else:
-        note1 = firstNote
-        note2 = note1 + 3
-        note3 = note2 + 4
-    return note1, note2, note3
-
-def raiseNote(note1, note2, note3, raiseVal):
-    if raiseVal == "#":
-        return note1 + 1, note2 + 1, note3 + 1
-    elif raiseVal == "b":
-        return note1 - 1, note2 - 1, note3 - 1
-
-def chordAlteration(note1, note2, note3, ext):
-    if ext == "7":
-        note4 = note3 + 3
-    elif ext == "maj7":
-        note4 = note3 + 4
-    elif ext == "min7":
-        note4 = note3 + 3
-    elif ext == "minmaj7":
-        note4 = note3 + 4
-    elif ext == "dim7":
-        note2 -= 1
-        note3 -= 1
-        note4 = note3 + 3
-    elif ext == "hdim7":
-        note2 -= 1
-        note3 -= 1
-        note4 = note3 + 4
-    elif ext == "min6":
-        note4 = note3 + 5
-    elif ext == "maj6":
-        note4 = note3 + 4
-    elif ext == "sus2":
-        note2 = note1 + 2
-        note3 = note1 + 7
-        return note1, note2, note3
-    elif ext == "sus4":
-        note2 = note1 + 5
-        note3 = note1 + 7
-        return note1, note2, note3
-    elif ext == "dim":
-        note2 = note1 + 3
-        note3 = note2 + 3
-        return note1, note2, note3
-    elif ext == "aug":
-        note2 = note1 + 4
-        note3 = note2 + 4
-        return note1, note2, note3
-    elif ext == "maj":
-        note2 = note1 + 4
-        note3 = note2 + 3
-        return note1, note2, note3
-    elif ext == "min":
-        note2 = note1 + 3
-        note3 = note2 + 4
-        return note1, note2, note3
-    else:
-        raise ValueError(f"[chordAlteration] Sufijo no reconocido: {ext}")
-    return note1, note2, note3, note4
-
-def chordInversions3(note1, note2, note3, inv):
-    if inv == 1:
-        note1 += 12
-    elif inv == 2:
-        note1 += 12
-        note2 += 12
-    elif inv == 3:
-        # octava: subir las tres notas
-        note1 += 12
-        note2 += 12
-        note3 += 12
-    return note1, note2, note3
-
-def chordInversions4(note1, note2, note3, note4, inv):
-    if inv == 1:
-        note1 += 12
-    elif inv == 2:
-        note1 += 12
-        note2 += 12
-    elif inv == 3:
-        note1 += 12
-        note2 += 12
-        note3 += 12
-    return note1, note2, note3, note4
-
-def generate_progression(progression: str, name: str, output_dir=MIDI_DIR, tempo=60):
-    progChords = progression.split("-")
-    if len(progChords) not in [3, 4]:
-        raise ValueError("Only 3- or 4-chord progressions are supported.")
-
-    output_path = Path(output_dir) / name
+# Sufijos de acorde reconocidos (ver chord_theory.QUALITIES)
+ALTERATIONS_ARR = list(QUALITIES)
+
+Voicing = namedtuple("Voicing", ["filename", "key", "octave", "inversions", "notes", "durations"])
+Voicing.__doc__ = """
+Una voz (voicing) de la progresión, lista para escribir, renderizar o anotar.
+
+- filename: nombre del .mid correspondiente (ej. 'C#-3-ii7-V7-Imaj7-5.mid').
+- key: tónica (nombre de nota de NOTE_ARRAY, ej. 'C#').
+- octave: octava de la tónica.
+- inversions: tupla con la inversión de cada acorde.
+- notes: lista de (pitch, inicio, duración, velocity), tiempos en beats.
+- durations: duración de cada acorde en beats.
+"""
+
+# Tabla precalculada de voces
+# ----------------------------
+# Cada fila guarda los intervalos (semitonos desde la tónica de la tonalidad)
+# de un acorde ya invertido, indexada por (Chord, inversión). Las notas salen
+# de chord_theory, el mismo núcleo que produce las etiquetas JAMS, y la tabla se
+# construye una sola vez al importar, de modo que el bucle de generación no
+# vuelve a ramificar por cada tónica y acorde. Las inversiones se calculan a la
+# vez para acordes de cualquier tamaño: la inversión k sube una octava las k
+# primeras notas del array de intervalos.
+#
+# Cada acorde tiene max(NUM_INVERSIONS, notas) inversiones (ver chord_inversions):
+# una triada tiene 4 (la 3 sube el acorde entero una octava) y un acorde de
+# N >= 4 notas tiene sus N inversiones (una novena, 5; una trecena, 6). El número
+# de voz codifica las inversiones en base mixta con esas bases.
+
+NUM_INVERSIONS = 4  # inversiones mínimas por acorde (triadas con octava adicional)
+MAX_CHORD_SIZE = max(len(intervals) for intervals in QUALITIES.values())
+MAX_INVERSIONS = max(NUM_INVERSIONS, MAX_CHORD_SIZE)  # filas de la tabla por acorde
+# Notas por acorde en los arrays de una progresión de triadas o cuatríadas.
+# Fija la disposición de las velocities en el flujo aleatorio, así que una
+# semilla da las mismas voces aunque QUALITIES crezca (ver chord_width).
+BASE_CHORD_SIZE = 4
+
+# INVERSION_SHIFTS[inv, nota] = 12 si la inversión inv sube esa nota
+INVERSION_SHIFTS = 12 * (np.arange(MAX_CHORD_SIZE)[None, :] < np.arange(MAX_INVERSIONS)[:, None])
+
+def chord_inversions(chord: Chord) -> int:
+    """
+    Número de inversiones de un acorde: NUM_INVERSIONS, o sus notas si tiene más.
+    """
+    return max(NUM_INVERSIONS, len(chord))
+
+def _voicing_rows(chords: list) -> tuple:
+    """
+    Filas de las MAX_INVERSIONS primeras inversiones de cada acorde (en ese
+    orden; las que pasan de chord_inversions no se usan) y sus tamaños,
+    calculadas con un solo broadcasting sobre arrays de N notas.
+    """
+    sizes = np.array([len(chord) for chord in chords], dtype=np.int8)
+    intervals = np.zeros((len(chords), MAX_CHORD_SIZE), dtype=np.int16)
+    for c, chord in enumerate(chords):
+        intervals[c, :len(chord)] = chord.intervals
+    offsets = np.array([chord.root_offset() for chord in chords], dtype=np.int16)
+    rows = offsets[:, None, None] + intervals[:, None, :] + INVERSION_SHIFTS[None]
+    rows[np.broadcast_to(np.arange(MAX_CHORD_SIZE)[None, None, :] >= sizes[:, None, None], rows.shape)] = 0
+    return rows.reshape(-1, MAX_CHORD_SIZE).astype(np.int16), np.repeat(sizes, MAX_INVERSIONS)
+
+def _build_voicing_table():
+    chords = [
+        Chord(degree, accidental, upper, quality)
+        for degree, accidental, upper, quality in itertools.product(
+            range(7), ACCIDENTALS.values(), (True, False), QUALITIES)
+    ]
+    index = {(chord, inv): c * MAX_INVERSIONS + inv
+             for c, chord in enumerate(chords) for inv in range(MAX_INVERSIONS)}
+    return (index,) + _voicing_rows(chords)
+
+# VOICING_INDEX[(Chord, inversión)] -> fila de VOICING_TABLE
+VOICING_INDEX, VOICING_TABLE, VOICING_SIZES = _build_voicing_table()
+
+_VOICING_LOCK = threading.Lock()
+
+def _add_voicings(chord: Chord):
+    """
+    Añade a la tabla las inversiones de un acorde que no está precalculado
+    (dominantes secundarias como 'V,7/V'), la primera vez que se pide.
+
+    La tabla solo crece: primero se publican las filas nuevas y después sus
+    entradas en VOICING_INDEX (la de la inversión 0 la última, que es la que
+    consulta progression_rows), así que un hilo que lee sin el lock nunca ve
+    un índice fuera de la tabla. El lock evita añadir dos veces el mismo acorde.
+    """
+    global VOICING_TABLE, VOICING_SIZES
+    with _VOICING_LOCK:
+        if (chord, 0) in VOICING_INDEX:
+            return
+        rows, sizes = _voicing_rows([chord])
+        start = len(VOICING_TABLE)
+        VOICING_TABLE = np.concatenate([VOICING_TABLE, rows])
+        VOICING_SIZES = np.concatenate([VOICING_SIZES, sizes])
+        for inv in reversed(range(MAX_INVERSIONS)):
+            VOICING_INDEX[(chord, inv)] = start + inv
+
+def chord_width(chords) -> int:
+    """
+    Notas por acorde en los arrays de voces de una progresión: BASE_CHORD_SIZE,
+    o el tamaño de su acorde más grande si lo supera (novenas, trecenas...).
+    """
+    return max([BASE_CHORD_SIZE] + [len(chord) for chord in chords])
+
+def progression_rows(chords) -> np.ndarray:
+    """
+    Filas de VOICING_TABLE de cada acorde e inversión: array (acordes, MAX_INVERSIONS).
+
+    :param chords: Acordes (Chord) o numerales (ej. "ii,7"), ver chord_theory.parse_chord.
+    """
+    chords = [c if isinstance(c, Chord) else parse_chord(c) for c in chords]
+    for chord in chords:
+        if (chord, 0) not in VOICING_INDEX:
+            _add_voicings(chord)
+    return np.array([[VOICING_INDEX[(chord, inv)] for inv in range(MAX_INVERSIONS)] for chord in chords])
+
+ROOT_NAMES = [(n, o) for o in OCTAVE_ARRAY for n in NOTE_ARRAY]
+
+def root_index(note: str, octave: int) -> int:
+    """
+    Índice de tónica de (nota, octava): semitonos desde la primera tónica de
+    ROOT_NAMES (C-2, nota MIDI 24). Coincide con el índice en ROOT_NAMES para las
+    octavas de OCTAVE_ARRAY y se extiende a cualquier otra octava.
+    """
+    if note not in NOTE_ARRAY:
+        raise ValueError(f"[generate_progression] Nota no reconocida: {note} (opciones: {NOTE_ARRAY})")
+    return (octave - OCTAVE_ARRAY[0]) * 12 + NOTE_ARRAY.index(note)
+
+def root_name(root: int) -> tuple:
+    """
+    (nota, octava) de un índice de tónica (inversa de root_index).
+    """
+    return NOTE_ARRAY[root % 12], OCTAVE_ARRAY[0] + root // 12
+
+# Aleatoriedad reproducible
+# -------------------------
+# Cada (semilla, progresión, tónica) tiene su propio generador Philox (basado en
+# contador). La voz número `num` consume siempre el mismo bloque de números
+# uniformes, así que se puede regenerar cualquier archivo saltando directamente
+# a su bloque, sin generar los anteriores, y el resultado no depende del orden
+# ni del proceso en que se genere.
+
+VELOCITY_RANGE = (60, 127)    # rango expresivo, evita notas muy suaves (< 60)
+DURATION_RANGE = (0.5, 2.0)   # duración de cada acorde en beats (2 decimales)
+_PHILOX_WORDS = 4             # Philox produce 4 números de 64 bits por paso de contador
+_SAMPLE_STREAM = 1 << 32      # flujo del muestreo, fuera del rango de claves de tónica
+
+# Separadores que no pueden aparecer en el nombre (es carpeta y parte de los .mid)
+_PATH_SEPARATORS = tuple(sorted({"/", "\\", os.sep, os.altsep or os.sep}))
+
+def progression_name(progression: str) -> str:
+    """
+    Nombre por defecto de una progresión: sin comas y con los separadores de
+    ruta (p. ej. la '/' de una dominante secundaria) cambiados por '_'.
+    "V,7/V-V,7-I,maj7" -> "V7_V-V7-Imaj7".
+    """
+    name = progression.replace(",", "")
+    for sep in _PATH_SEPARATORS:
+        name = name.replace(sep, "_")
+    return name
+
+def check_name(name: str, caller: str = "generate_progression") -> str:
+    """
+    Retorna `name` si sirve como carpeta y prefijo de archivo; si contiene un
+    separador de ruta lanza ValueError (ver progression_name).
+    """
+    if any(sep in name for sep in _PATH_SEPARATORS):
+        raise ValueError(f"[{caller}] Nombre con separador de ruta: {name!r} "
+                         f"(usa p. ej. {progression_name(name)!r})")
+    return name
+
+def resolve_seed(seed=None) -> int:
+    """
+    Retorna la semilla dada o, si es None, una nueva con entropía del sistema.
+    """
+    if seed is None:
+        return int(np.random.SeedSequence().entropy)
+    return int(seed)
+
+def _root_generator(seed: int, progression: str, root: int) -> np.random.Philox:
+    # SeedSequence solo acepta enteros no negativos: las tónicas por debajo de
+    # OCTAVE_ARRAY[0] (índice negativo) se llevan a 32 bits sin signo
+    key = np.random.SeedSequence(
+        [seed, zlib.crc32(progression.encode("utf-8")), root & 0xFFFFFFFF]
+    ).generate_state(2, dtype=np.uint64)
+    return np.random.Philox(key=key)
+
+def _block_size(num_chords: int, width: int = BASE_CHORD_SIZE) -> int:
+    # duraciones + velocities (width por acorde), redondeado a pasos de Philox
+    words = num_chords * (1 + width)
+    return -(-words // _PHILOX_WORDS) * _PHILOX_WORDS
+
+def draw_randomness(seed: int, progression: str, root: int, num_chords: int,
+                    start: int = 0, count: int = 1, width: int = BASE_CHORD_SIZE) -> tuple:
+    """
+    Duraciones y velocities de las voces `start .. start+count-1` de una tónica,
+    en una sola llamada vectorizada.
+
+    :param width: Notas por acorde de la progresión (ver chord_width).
+    :return: (durations, velocities): arrays (count, acordes) en beats y
+             (count, acordes, width) enteros.
+    """
+    block = _block_size(num_chords, width)
+    bitgen = _root_generator(seed, progression, root)
+    bitgen.advance(start * block // _PHILOX_WORDS)
+    u = np.random.Generator(bitgen).random((count, block))
+
+    low, high = DURATION_RANGE
+    # Centésimas enteras / 100 => mismos floats que round(x, 2)
+    durations = np.rint((low + u[:, :num_chords] * (high - low)) * 100) / 100
+
+    vlow, vhigh = VELOCITY_RANGE
+    velocities = vlow + (u[:, num_chords:num_chords * (1 + width)]
+                         * (vhigh - vlow + 1)).astype(np.int64)
+    return durations, velocities.reshape(count, num_chords, width)
+
+MIN_CHORDS, MAX_CHORDS = 2, 8  # acordes por progresión (ej. turnarounds y frases de 8 compases)
+
+def _split_progression(progression: str) -> tuple:
+    """
+    Acordes (Chord) de la progresión, analizados una sola vez (ver chord_theory).
+    """
+    progChords = parse_progression(progression)
+    if not MIN_CHORDS <= len(progChords) <= MAX_CHORDS:
+        raise ValueError(
+            f"[generate_progression] Progresión de {len(progChords)} acordes: se admiten "
+            f"de {MIN_CHORDS} a {MAX_CHORDS} ('{progression}')"
+        )
+    return progChords
+
+def resolve_roots(roots=None, octaves=None) -> list:
+    """
+    Índices de tónica (ver root_index) a generar, ordenados y sin repetir.
+
+    :param roots: None (las 12 notas), o lista de nombres de nota ('C', 'F#'...,
+                  en cada octava de `octaves`), pares (nota, octava) o índices
+                  de tónica (enteros, como los de ROOT_NAMES).
+    :param octaves: Octavas para los nombres de nota; por defecto OCTAVE_ARRAY.
+    """
+    if octaves is None:
+        octaves = OCTAVE_ARRAY
+    if roots is None:
+        roots = NOTE_ARRAY
+    indices = set()
+    for root in roots:
+        if isinstance(root, str):
+            indices.update(root_index(root, octave) for octave in octaves)
+        elif isinstance(root, tuple):
+            indices.add(root_index(*root))
+        else:
+            indices.add(int(root))
+    return sorted(indices)
+
+def progression_radices(chords) -> list:
+    """
+    Bases del número de voz: inversiones de cada acorde (ver chord_inversions).
+    """
+    return [chord_inversions(chord) for chord in chords]
+
+def radix_weights(radices) -> np.ndarray:
+    """
+    Peso de cada dígito en base mixta: producto de las bases de los acordes
+    siguientes (el último acorde pesa 1).
+    """
+    return np.cumprod([1] + list(radices[:0:-1]), dtype=np.int64)[::-1]
+
+def decode_inversions(nums, radices, weights=None) -> np.ndarray:
+    """
+    Decodificación en base mixta: dígitos de cada número (c1 es el más
+    significativo), como array (números, acordes). Con las bases de
+    progression_radices, los dígitos son las inversiones de cada número de voz,
+    sin enumerar todas las tuplas de inversiones.
+
+    :param weights: radix_weights(radices), si ya está calculado.
+    """
+    nums = np.asarray(nums, dtype=np.int64)
+    if weights is None:
+        weights = radix_weights(radices)
+    return nums[:, None] // weights[None, :] % np.asarray(radices)[None, :]
+
+class InversionProduct:
+    """
+    Números de voz (ascendentes) cuyas inversiones están en las permitidas de
+    cada acorde, como secuencia perezosa: el elemento k se obtiene decodificando
+    k en base mixta (len(permitidas) por acorde) y volviendo a codificar las
+    inversiones con las bases de la progresión. Se indexa con enteros o arrays.
+
+    :param allowed: Inversiones permitidas de cada acorde (ej. [[0], [0, 1], [0, 1, 2, 3]]).
+    :param radices: Inversiones de cada acorde (ver progression_radices).
+    """
+
+    def __init__(self, allowed: list, radices: list):
+        self.allowed = [np.array(sorted(set(per_chord)), dtype=np.int64) for per_chord in allowed]
+        for per_chord, radix in zip(self.allowed, radices):
+            if len(per_chord) and not 0 <= per_chord[0] <= per_chord[-1] < radix:
+                raise ValueError(f"[generate_progression] Inversiones fuera de 0..{radix - 1}: {allowed}")
+        self.radices = [len(per_chord) for per_chord in self.allowed]
+        self._weights = radix_weights(radices)
+
+    def __len__(self):
+        return int(np.prod(self.radices, dtype=np.int64))
+
+    def __getitem__(self, index):
+        digits = decode_inversions(np.atleast_1d(index), self.radices)
+        invs = np.stack([self.allowed[c][digits[:, c]] for c in range(len(self.allowed))], axis=1)
+        nums = invs @ self._weights
+        return nums if np.ndim(index) else int(nums[0])
+
+    def __iter__(self):
+        for start in range(0, len(self), 4096):
+            yield from self[np.arange(start, min(start + 4096, len(self)))].tolist()
+
+def _allowed_numbers(radices: list, inversions=None):
+    """
+    Números de voz cuyas inversiones pasan el filtro `inversions`:
+    None (todas), inversiones permitidas para todos los acordes (ej. {0, 1};
+    cada acorde toma las que tiene), una lista con las permitidas por acorde
+    (ej. [[0], [0, 1], [0, 1, 2, 3]]) o una función (tupla de inversiones) -> bool.
+
+    :param radices: Inversiones de cada acorde (ver progression_radices).
+    :return: Secuencia ascendente indexable: InversionProduct (sin enumerar las
+             voces) o, con una función, un array con las que la cumplen.
+    """
+    num_chords = len(radices)
+    if inversions is None:
+        return InversionProduct([range(radix) for radix in radices], radices)
+    if callable(inversions):
+        nums = np.arange(int(np.prod(radices, dtype=np.int64)))
+        tuples = decode_inversions(nums, radices).tolist()
+        return nums[[bool(inversions(tuple(invs))) for invs in tuples]]
+    inversions = list(inversions)
+    if all(isinstance(inv, int) for inv in inversions):
+        inversions = [[inv for inv in inversions if inv < radix] for radix in radices]
+    if len(inversions) != num_chords:
+        raise ValueError(
+            f"[generate_progression] Filtro de inversiones para {len(inversions)} acordes "
+            f"en una progresión de {num_chords}"
+        )
+    return InversionProduct(inversions, radices)
+
+def select_voicings(progression: str, roots=None, octaves=None, inversions=None,
+                    sample: int = None, seed=None, max_voicings: int = MAX_VOICINGS) -> list:
+    """
+    Elige qué voces generar, sin generarlas: tónicas (ver resolve_roots),
+    filtro de inversiones (ver _allowed_numbers) y, opcionalmente, una muestra
+    aleatoria estratificada por tónica de `sample` voces (cada tónica recibe
+    sample // tónicas voces, y el resto va a tónicas elegidas al azar).
+
+    La muestra depende solo de (seed, progresión y filtros), y los números de voz
+    son los de la generación completa: una voz elegida es idéntica a la misma
+    voz de la progresión completa. Solo se enumeran las voces elegidas, así que
+    el coste crece con el tamaño de la muestra y no con el total de combinaciones.
+
+    :param max_voicings: Tope de voces de la selección (por defecto MAX_VOICINGS
+                         de config.py; None = sin tope). Si la selección lo supera,
+                         se lanza ValueError en lugar de generar millones de archivos:
+                         hay que pedir una muestra o filtrar tónicas e inversiones.
+    :return: Lista de (tónica, [números de voz ascendentes]) en orden de tónica.
+    """
+    radices = progression_radices(_split_progression(progression))
+    root_list = resolve_roots(roots, octaves)
+    allowed = _allowed_numbers(radices, inversions)
+    if not root_list or not len(allowed):
+        raise ValueError(f"[select_voicings] La selección no contiene ninguna voz de '{progression}'")
+
+    total = len(root_list) * len(allowed) if sample is None else min(int(sample), len(root_list) * len(allowed))
+    if max_voicings is not None and total > max_voicings:
+        raise ValueError(
+            f"[select_voicings] La selección de '{progression}' tiene {total} voces (tope: {max_voicings}); "
+            f"usa sample=..., filtra tónicas / inversiones o sube max_voicings"
+        )
+
+    if sample is None:
+        return [(root, list(allowed)) for root in root_list]
+
+    rng = np.random.default_rng([resolve_seed(seed), zlib.crc32(progression.encode("utf-8")), _SAMPLE_STREAM])
+    base, extra = divmod(total, len(root_list))
+    lucky = set(rng.choice(len(root_list), extra, replace=False).tolist())
+    selection = []
+    for pos, root in enumerate(root_list):
+        count = base + (pos in lucky)
+        if count:
+            nums = allowed[rng.choice(len(allowed), count, replace=False)]
+            selection.append((root, sorted(nums.tolist())))
+    return selection
+
+VoicingRecord = namedtuple("VoicingRecord", [
+    "root", "num", "inversions", "notes", "onsets", "durations", "velocities"
+])
+VoicingRecord.__doc__ = """
+Registro compacto de una voz para consumidores en memoria (aumentación en
+entrenamiento, modelos simbólicos), sin nombres de archivo ni listas de tuplas.
+
+- root: índice de tónica (ver root_index / root_name).
+- num: número de voz dentro de la tónica (el del nombre de archivo).
+- inversions: tupla con la inversión de cada acorde.
+- notes: array int16 (acordes, notas por acorde; ver chord_width) con las notas MIDI, rellenado con PAD (-1).
+- onsets: array (acordes,) con el inicio de cada acorde en beats.
+- durations: array (acordes,) con la duración de cada acorde en beats.
+- velocities: array int16 (acordes, notas por acorde), rellenado con PAD.
+"""
+
+def record_to_voicing(record: VoicingRecord, name: str) -> Voicing:
+    """
+    Convierte un VoicingRecord en el Voicing (con nombre de archivo y lista de
+    notas) que consumen los escritores de .mid, el render y la anotación.
+    """
+    key, octave = root_name(record.root)
+    onsets = record.onsets.tolist()
+    durations = record.durations.tolist()
+    notes = []
+    for chord_idx, (pitches, velocities) in enumerate(zip(record.notes.tolist(), record.velocities.tolist())):
+        for pitch, velocity in zip(pitches, velocities):
+            if pitch != PAD:
+                notes.append((pitch, onsets[chord_idx], durations[chord_idx], velocity))
+    filename = f"{key}-{octave}-{name}-{record.num}.mid"
+    return Voicing(filename, key, octave, record.inversions, notes, durations)
+
+class VoicingSequence:
+    """
+    Secuencia perezosa de las voces de una progresión (o de una selección, ver
+    select_voicings), con longitud y acceso aleatorio por índice. No guarda las
+    voces: cada una se calcula al pedirla (la aleatoriedad salta directamente a
+    su bloque de Philox), así que un data loader puede repartir los índices
+    entre procesos, p. ej. con shard(worker, num_workers).
+
+    Iterarla recorre las voces en orden, calculando notas y aleatoriedad en
+    bloque por tónica; seq[i] da el mismo registro que la iteración.
+
+    :param progression: Progresión con comas, ej. "ii,7-V,7-I,maj7".
+    :param name: Nombre de la progresión (para los nombres de archivo de voicing(i)).
+    :param seed: Semilla (ver iter_voicings). Sin semilla se elige una y queda en .seed.
+    :param roots, octaves, inversions, sample, max_voicings: Selección de voces (ver select_voicings).
+    :param selection: Selección ya calculada (lista de (tónica, números de voz)),
+                      en lugar de roots / octaves / inversions / sample.
+    """
+
+    def __init__(self, progression: str, name: str = "", seed=None, roots=None, octaves=None,
+                 inversions=None, sample: int = None, selection: list = None,
+                 max_voicings: int = MAX_VOICINGS):
+        self.progression = progression
+        self.name = check_name(name, "iter_voicings")
+        self.seed = resolve_seed(seed)
+        if selection is None:
+            selection = select_voicings(progression, roots, octaves, inversions, sample, self.seed, max_voicings)
+        self.selection = [(root, list(nums)) for root, nums in selection if len(nums)]
+
+        self.chords = _split_progression(progression)
+        self.num_chords = len(self.chords)
+        self.width = chord_width(self.chords)
+        self.radices = progression_radices(self.chords)
+        self._weights = radix_weights(self.radices)
+        rows = progression_rows(self.chords)
+        # Intervalos de cada acorde e inversión: (acordes, MAX_INVERSIONS, width)
+        self._intervals = VOICING_TABLE[rows][:, :, :self.width]
+        self._padding = np.arange(self.width)[None, :] >= VOICING_SIZES[rows[:, 0]][:, None]
+        self._roots = [int(root) for root, _ in self.selection]
+        self._nums = [np.array(nums) for _, nums in self.selection]
+        self._starts = np.cumsum([0] + [len(nums) for nums in self._nums])
+
+        if self._roots:
+            used = (~self._padding[:, None, :]
+                    & (np.arange(MAX_INVERSIONS)[None, :, None] < np.array(self.radices)[:, None, None]))
+            intervals = self._intervals[used]
+            low = 24 + min(self._roots) + int(intervals.min())
+            high = 24 + max(self._roots) + int(intervals.max())
+            if low < 0 or high > 127:
+                raise ValueError(f"[generate_progression] Tónicas fuera del rango MIDI 0-127 para '{progression}'")
+
+    def __len__(self):
+        return int(self._starts[-1])
+
+    def _randomness(self, root: int, nums: np.ndarray) -> tuple:
+        """
+        Duraciones y velocities de las voces `nums` (ascendentes) de una tónica,
+        con una llamada a draw_randomness por tramo de números consecutivos: una
+        muestra dispersa no recorre los huecos entre voces elegidas.
+        """
+        if int(nums[-1]) - int(nums[0]) + 1 == len(nums):
+            return draw_randomness(self.seed, self.progression, root, self.num_chords,
+                                   start=int(nums[0]), count=len(nums), width=self.width)
+        runs = np.split(nums, np.flatnonzero(np.diff(nums) != 1) + 1)
+        draws = [
+            draw_randomness(self.seed, self.progression, root, self.num_chords,
+                            start=int(run[0]), count=len(run), width=self.width)
+            for run in runs
+        ]
+        return np.concatenate([d for d, _ in draws]), np.concatenate([v for _, v in draws])
+
+    def _block(self, pos: int, lo: int, hi: int) -> list:
+        """
+        Registros de las voces lo..hi-1 de la tónica número `pos` de la selección.
+        """
+        root = self._roots[pos]
+        nums = self._nums[pos][lo:hi]
+        with instrumentation.timer("generate.randomness"):
+            durations, velocities = self._randomness(root, nums)
+        velocities = velocities.astype(np.int16)
+        invs = decode_inversions(nums, self.radices, self._weights)
+        with instrumentation.timer("generate.voicing_table"):
+            notes = 24 + root + self._intervals[np.arange(self.num_chords)[None, :], invs]
+        notes[:, self._padding] = PAD
+        velocities[:, self._padding] = PAD
+        # Suma acumulada secuencial: los mismos floats que ir sumando duraciones
+        onsets = np.zeros_like(durations)
+        onsets[:, 1:] = np.cumsum(durations[:, :-1], axis=1)
+        invs = invs.tolist()
+        return [
+            VoicingRecord(root, int(num), tuple(invs[j]), notes[j], onsets[j], durations[j], velocities[j])
+            for j, num in enumerate(nums.tolist())
+        ]
+
+    def _locate(self, index: int) -> tuple:
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(f"[VoicingSequence] Índice fuera de rango: {index}")
+        pos = int(np.searchsorted(self._starts, index, side="right")) - 1
+        return pos, index - int(self._starts[pos])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step == 1:
+                return list(self.records(start, stop))
+            return [self[i] for i in range(start, stop, step)]
+        pos, offset = self._locate(index)
+        return self._block(pos, offset, offset + 1)[0]
+
+    def records(self, start: int = 0, stop: int = None):
+        """
+        Itera los registros start..stop-1, en bloques por tónica.
+        """
+        stop = len(self) if stop is None else min(stop, len(self))
+        while start < stop:
+            pos, offset = self._locate(start)
+            count = min(len(self._nums[pos]) - offset, stop - start)
+            yield from self._block(pos, offset, offset + count)
+            start += count
+
+    def __iter__(self):
+        return self.records()
+
+    def shard(self, worker: int, num_workers: int) -> range:
+        """
+        Rango contiguo de índices que le toca al proceso `worker` de `num_workers`.
+        """
+        per_worker = -(-len(self) // num_workers)
+        return range(worker * per_worker, min((worker + 1) * per_worker, len(self)))
+
+    def voicing(self, index: int) -> Voicing:
+        """
+        La voz número `index` como Voicing (con nombre de archivo y notas).
+        """
+        return record_to_voicing(self[index], self.name)
+
+    def voicings(self, start: int = 0, stop: int = None):
+        """
+        Itera las voces como Voicing (lo que consumen los escritores de .mid).
+        """
+        for record in self.records(start, stop):
+            yield record_to_voicing(record, self.name)
+
+def iter_voicings(progression: str, name: str, roots=None, seed=None,
+                  octaves=None, inversions=None, sample: int = None):
+    """
+    Genera, una a una, las voces de la progresión sin escribir nada a disco:
+    por defecto todas las tonalidades (NOTE_ARRAY x OCTAVE_ARRAY) y todas las
+    inversiones, o solo la selección indicada (ver select_voicings). Para
+    acceso aleatorio o registros compactos, ver VoicingSequence.
+
+    :param progression: Progresión con comas, ej. "ii,7-V,7-I,maj7".
+    :param name: Nombre de la progresión (se usa en los nombres de archivo).
+    :param roots: Tónicas a generar (ver resolve_roots; por defecto, todas).
+    :param seed: Semilla. Cada voz usa un flujo independiente derivado de
+                 (seed, progresión, tónica, número de voz). Sin semilla se
+                 elige una nueva en cada llamada.
+    :param octaves: Octavas de las tónicas (por defecto OCTAVE_ARRAY).
+    :param inversions: Filtro de inversiones (ver _allowed_numbers).
+    :param sample: Si se indica, muestra estratificada de ese número de voces.
+    :return: Iterador de Voicing.
+    """
+    sequence = VoicingSequence(progression, name, seed, roots, octaves, inversions, sample)
+    return sequence.voicings()
+
+def get_voicing(progression: str, name: str, root: int, num: int, seed: int) -> Voicing:
+    """
+    Regenera una sola voz (tónica `root`, número `num`) sin generar el resto
+    de la progresión. Con la misma semilla coincide con la de iter_voicings.
+    """
+    radices = progression_radices(_split_progression(progression))
+    if not 0 <= num < int(np.prod(radices, dtype=np.int64)):
+        raise ValueError(f"[get_voicing] Número de voz fuera de rango: {num}")
+    return VoicingSequence(progression, name, seed, selection=[(root, [num])]).voicing(0)
+
+def voicing_to_midi(voicing: Voicing, tempo=60) -> MIDIFile:
+    """
+    Construye el MIDIFile (una pista) de una voz. Es la implementación de
+    referencia: para escribir archivos se usa voicing_to_midi_bytes, que
+    produce los mismos bytes sin pasar por midiutil.
+    """
+    track = 0
+    channel = 0
+    MyMIDI = MIDIFile(1)
+    MyMIDI.addTempo(track, 0, tempo)
+    for pitch, start, duration, velocity in voicing.notes:
+        MyMIDI.addNote(track, channel, pitch, start, duration, velocity)
+    return MyMIDI
+
+def voicing_to_midi_bytes(voicing: Voicing, tempo=60) -> bytes:
+    """
+    Bytes del .mid de una voz, serializados directamente (ver midi_io.encode_midi).
+    """
+    return encode_midi(voicing.notes, tempo)
+
+def midi_digest(voicing: Voicing, progression: str, seed: int, tempo) -> str:
+    """
+    Hash de entrada de un .mid para el manifiesto incremental.
+    """
+    return artifact_hash(
+        kind="midi", progression=progression, filename=voicing.filename,
+        root=(voicing.key, voicing.octave), inversions=voicing.inversions,
+        seed=seed, tempo=tempo, theory=THEORY_VERSION
+    )
+
+def _write_roots(progression, name, output_path, tempo, seed, selection, known=None, to_shards=False) -> tuple:
+    """
+    Escribe los .mid de una selección (lista de (tónica, números de voz), ver
+    select_voicings) y retorna (lista de (archivo, duraciones), mapa de hashes,
+    bytes, columnas de metadatos). Es la unidad de trabajo de cada proceso en el
+    modo paralelo.
+
+    :param known: Hashes ya registrados en el manifiesto {archivo: hash}. Los .mid
+                  que existen con el mismo hash no se reescriben. None = reescribir todo.
+    :param to_shards: Si es True, no escribe archivos: retorna los .mid como
+                      lista de (archivo, bytes) para guardarlos en shards.
+    """
+    durations = []
+    digests = {}
+    blobs = []
+    voicings = []
+    for voicing in VoicingSequence(progression, name, seed, selection=selection).voicings():
+        durations.append((voicing.filename, voicing.durations))
+        voicings.append(voicing)
+        if to_shards:
+            with instrumentation.timer("generate.encode_midi"):
+                blobs.append((voicing.filename, voicing_to_midi_bytes(voicing, tempo)))
+            instrumentation.observe("generate.midi_bytes", len(blobs[-1][1]))
+            continue
+        digest = midi_digest(voicing, progression, seed, tempo)
+        filepath = output_path / voicing.filename
+        if known is None or known.get(voicing.filename) != digest or not filepath.exists():
+            with instrumentation.timer("generate.encode_midi"):
+                data = voicing_to_midi_bytes(voicing, tempo)
+            with instrumentation.timer("generate.write_file"):
+                filepath.write_bytes(data)
+            instrumentation.count("generate.files_written")
+            instrumentation.observe("generate.midi_bytes", len(data))
+        else:
+            instrumentation.count("generate.files_skipped")
+        digests[voicing.filename] = digest
+    chords = _split_progression(progression)
+    with instrumentation.timer("generate.metadata_columns"):
+        columns = voicing_columns(voicings, len(chords), chord_width(chords), NOTE_ARRAY)
+    return durations, digests, blobs, columns
+
+def _write_roots_task(collect_metrics: bool, *args) -> tuple:
+    """
+    _write_roots en un proceso del pool. Con collect_metrics, retorna también
+    el snapshot de instrumentación del proceso para sumarlo en el principal.
+    """
+    if not collect_metrics:
+        return _write_roots(*args), None
+    instrumentation.enable()
+    result = _write_roots(*args)
+    return result, instrumentation.snapshot()
+
+def generate_progression(
+    progression: str,
+    name: str,
+    output_dir=MIDI_DIR,
+    tempo=60,
+    seed=None,
+    max_workers: int = 1,
+    incremental: bool = True,
+    shard_dir=None,
+    roots=None,
+    octaves=None,
+    inversions=None,
+    sample: int = None,
+    max_voicings: int = MAX_VOICINGS
+):
+    """
+    Genera los .mid de la progresión en todas las tonalidades e inversiones
+    (o en el subconjunto elegido con roots / octaves / inversions / sample),
+    más un durations.jsonl (ver durations_store.py) con la duración de cada
+    acorde por archivo, escrito a medida que se generan, y un metadata.npz con el índice columnar de metadatos (ver metadata.py).
+
+    :param progression: Progresión con comas, ej. "ii,7-V,7-I,maj7".
+    :param name: Nombre de la progresión (carpeta y nombres de archivo).
+    :param output_dir: Carpeta base de salida.
+    :param tempo: BPM.
+    :param seed: Semilla para velocities y duraciones (ver iter_voicings).
+                 Sin semilla se elige una y se imprime, para poder reproducir la salida.
+    :param max_workers: Si es > 1, reparte las tónicas entre un pool de procesos;
+                        la salida es idéntica byte a byte a la serial.
+    :param incremental: Si es True, no reescribe los .mid que ya están al día según
+                        el manifest.json de la carpeta (solo tiene efecto con semilla fija).
+    :param shard_dir: Si se indica, los .mid se escriben en shards dentro de
+                      shard_dir/name (campo 'midi', id = nombre sin extensión) en
+                      lugar de archivos sueltos; durations.jsonl va a esa misma carpeta.
+    :param roots: Tónicas a generar: nombres de nota, pares (nota, octava) o
+                  índices (ver resolve_roots). Por defecto, todas.
+    :param octaves: Octavas de las tónicas, en lugar de OCTAVE_ARRAY (ej. range(3, 5)).
+    :param inversions: Filtro de inversiones: permitidas para todos los acordes
+                       (ej. {0, 1}), por acorde (ej. [[0], [0, 1], [0, 1, 2, 3]]) o
+                       una función (tupla de inversiones) -> bool.
+    :param sample: Número de voces de una muestra aleatoria estratificada por
+                   tónica (reproducible con la semilla). Solo se calculan y
+                   escriben las voces elegidas, con los mismos nombres y contenido
+                   que en la generación completa.
+    :param max_voicings: Tope de archivos (ver select_voicings; None = sin tope).
+    """
+    check_name(name)
+    started = time.perf_counter()
+    to_shards = shard_dir is not None
+    output_path = Path(shard_dir if to_shards else output_dir) / name
     output_path.mkdir(parents=True, exist_ok=True)
+    # Se fija una vez aquí para que todos los procesos compartan la misma
+    seed = resolve_seed(seed)
+    selection = select_voicings(progression, roots, octaves, inversions, sample, seed, max_voicings)
+    manifest = None if to_shards else BuildManifest(output_path)
+    known = manifest.entries if incremental and manifest is not None else None
+    writer = ShardWriter(output_path) if to_shards else None
+    durations_writer = DurationsWriter(output_path)
+
+    def collect(durations, digests, blobs, columns):
+        for filename, file_durations in durations:
+            durations_writer.add(filename, file_durations)
+        metadata_chunks.append(columns)
+        if manifest is not None:
+            manifest.entries.update(digests)
+        for filename, data in blobs:
+            writer.add(Path(filename).stem, midi=data)
+
+    metadata_chunks = []
+    if max_workers > 1:
+        # Una tarea por tónica; se fusionan en orden de tónica, así el
+        # durations.jsonl queda en el mismo orden que en la versión serial
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = []
+            for item in selection:
+                prefix = "{}-{}-".format(*root_name(item[0]))
+                root_known = None if known is None else {
+                    k: v for k, v in known.items() if k.startswith(prefix)
+                }
+                futures.append(pool.submit(
+                    _write_roots_task, instrumentation.enabled(), progression, name,
+                    output_path, tempo, seed, [item], root_known, to_shards
+                ))
+            for future in futures:
+                result, metrics = future.result()
+                instrumentation.merge(metrics)
+                collect(*result)
+    else:
+        # En serie, una tónica a la vez para no acumular los bytes de todas
+        for item in selection:
+            collect(*_write_roots(progression, name, output_path, tempo, seed, [item],
+                                  known, to_shards))
+
+    durations_writer.close()
+    with instrumentation.timer("generate.save_metadata"):
+        save_metadata(output_path, metadata_chunks, progression, name, NOTE_ARRAY, tempo)
+    if manifest is not None:
+        manifest.save()
+    if writer is not None:
+        writer.close()
+
+    instrumentation.add_time("generate.total", time.perf_counter() - started)
+    instrumentation.flush("generate")
+    print(f"Generated progression '{progression}' (seed={seed}) -> folder: {output_path}")
+
+
+def test_voicing_to_midi_bytes(progression="ii,7-V,7-I,maj7", seed=0, tempos=(60, 90, 137)):
+    """
+    Comprueba que voicing_to_midi_bytes produce exactamente los mismos bytes
+    que la referencia de midiutil (y, por tanto, el mismo flujo de eventos)
+    para todas las voces de una progresión.
+    """
+    import io
+
+    checked = 0
+    for voicing in iter_voicings(progression, "test", seed=seed):
+        for tempo in tempos:
+            buffer = io.BytesIO()
+            voicing_to_midi(voicing, tempo).writeFile(buffer)
+            if voicing_to_midi_bytes(voicing, tempo) != buffer.getvalue():
+                raise ValueError(f"[test_voicing_to_midi_bytes] Diferencia en {voicing.filename} (tempo={tempo})")
+            checked += 1
+    print(f"voicing_to_midi_bytes == midiutil en {checked} archivos")
+
+
+if __name__ == "__main__":
 
-    nameArray = [f"{n}-{o}" for o in OCTAVE_ARRAY for n in NOTE_ARRAY]
-    durations_dict = {}
-
-    for idx, noteName in enumerate(nameArray):
-        base_midi = 24 + idx
-        chordArr = []
-
-        for numeral in progChords:
-            numeralArr = numeral.split(',')
-            numeral_base = numeralArr[0]
-            firstNote = base_midi + ["I", "II", "III", "IV", "V", "VI", "VII"].index(numeral_base.upper()) * 2
-            note1, note2, note3 = baseChords(firstNote, numeral_base)
-            chord = (note1, note2, note3)
-
-            if len(numeralArr) > 1:
-                token = numeralArr[1]
-                if token in ["#", "b"]:
-                    note1, note2, note3 = raiseNote(note1, note2, note3, token)
-                    chord = (note1, note2, note3)
-                    if len(numeralArr) == 3 and numeralArr[2] in ALTERATIONS_ARR:
-                        chord = chordAlteration(note1, note2, note3, numeralArr[2])
-                elif token in ALTERATIONS_ARR:
-                    chord = chordAlteration(note1, note2, note3, token)
-                else:
-                    raise ValueError(f"[generate_progression] Token no reconocido: {token} en numeral {numeral}")
-
-            chordArr.append(chord)
-
-        track = 0
-        channel = 0
-        volume = 100
-
-        def random_velocity():
-            return random.randint(60, 127)  # rango expresivo, evita notas muy suaves (< 60)
-
-        def random_duration():
-            return round(random.uniform(0.5, 2.0), 2)
-
-        # def add_chord(MyMIDI, inv, timeOffset, duration):
-        #     for note in inv:
-        #         MyMIDI.addNote(track, channel, note, timeOffset, duration, volume)
-        #     return duration
-        
-        def add_chord(MyMIDI, inv, timeOffset, duration):
-            for note in inv:
-                velocity = random_velocity()
-                MyMIDI.addNote(track, channel, note, timeOffset, duration, velocity)
-            return duration 
-
-        num = 0
-        if len(chordArr) == 3:
-            num_inversions = 4 if len(chordArr[0]) == 3 else 4  # triadas con octava adicional
-            for c1 in range(num_inversions):
-                for c2 in range(num_inversions):
-                    for c3 in range(num_inversions):
-                        MyMIDI = MIDIFile(1)
-                        MyMIDI.addTempo(track, 0, tempo)
-                        timeOffset = 0
-                        durations = []
-                        for chord_data, c in zip(chordArr, [c1, c2, c3]):
-                            dur = random_duration()
-                            durations.append(dur)
-                            if len(chord_data) == 3:
-                                inv = chordInversions3(*chord_data, c)
-                            else:
-                                inv = chordInversions4(*chord_data, c)
-                            timeOffset += add_chord(MyMIDI, inv, timeOffset, dur)
-                        filename = f"{noteName}-{name}-{num}.mid"
-                        filepath = output_path / filename
-                        with open(filepath, "wb") as outmidi:
-                            MyMIDI.writeFile(outmidi)
-                        durations_dict[filename] = durations
-                        num += 1
-
-        elif len(chordArr) == 4:
-            num_inversions = 4
-            for c1 in range(num_inversions):
-                for c2 in range(num_inversions):
-                    for c3 in range(num_inversions):
-                        for c4 in range(num_inversions):
-                            MyMIDI = MIDIFile(1)
-                            MyMIDI.addTempo(track, 0, tempo)
-                            timeOffset = 0
-                            durations = []
-                            for chord_data, c in zip(chordArr, [c1, c2, c3, c4]):
-                                dur = random_duration()
-                                durations.append(dur)
-                                if len(chord_data) == 3:
-                                    inv = chordInversions3(*chord_data, c)
-                                else:
-                                    inv = chordInversions4(*chord_data, c)
-                                timeOffset += add_chord(MyMIDI, inv, timeOffset, dur)
-                            filename = f"{noteName}-{name}-{num}.mid"
-                            filepath = output_path / filename
-                            with open(filepath, "wb") as outmidi:
-                                MyMIDI.writeFile(outmidi)
-                            durations_dict[filename] = durations
-                            num += 1
-
-    durations_path = output_path / "durations.json"
-    with open(durations_path, "w") as f:
-        json.dump(durations_dict, f, indent=2)
-
-    print(f"Generated progression '{progression}' -> folder: {output_path}")
+    test_voicing_to_midi_bytes()
+    test_voicing_to_midi_bytes("I-IV-V")
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+
+"""
+Módulo: instrumentation
+-----------------------
+Capa ligera de instrumentación para las etapas del pipeline (generar,
+renderizar, anotar): contadores, temporizadores e histogramas por etapa y
+por archivo, que se envían a uno o varios sinks (log, archivo JSON o
+callback) al terminar cada etapa.
+
+Por defecto está desactivada: cada llamada se reduce a comprobar una
+variable global, así que se puede dejar en el código de producción.
+
+Uso:
+    from src import instrumentation
+    instrumentation.enable(instrumentation.JsonFileSink("metrics.jsonl"))
+    generate_progression(...)   # al terminar envía su reporte ("generate")
+"""
+
+import json
+import logging
+import math
+import threading
+import time
+from pathlib import Path
+
+_registry = None  # None = desactivada
+
+
+class Histogram:
+    """
+    Distribución de valores con cubetas en potencias de 2 (cada cubeta se
+    identifica por su límite superior), más conteo, suma, mínimo y máximo.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+        self.buckets = {}
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        upper = 2.0 ** math.frexp(value)[1] if value > 0 else 0.0
+        self.buckets[upper] = self.buckets.get(upper, 0) + 1
+
+    def merge(self, data: dict):
+        self.count += data["count"]
+        self.total += data["total"]
+        self.min = min(self.min, data["min"])
+        self.max = max(self.max, data["max"])
+        for upper, n in data["buckets"]:
+            self.buckets[upper] = self.buckets.get(upper, 0) + n
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "min": self.min if self.count else None,
+            "max": self.max if self.count else None,
+            "buckets": sorted(self.buckets.items()),
+        }
+
+
+class _Registry:
+    """
+    Métricas acumuladas desde el último flush. Es segura entre hilos.
+    """
+
+    def __init__(self, sinks):
+        self.sinks = list(sinks)
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.counters = {}
+        self.timers = {}
+        self.histograms = {}
+
+    def count(self, name: str, n: int):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, table: dict, name: str, value: float):
+        with self.lock:
+            if name not in table:
+                table[name] = Histogram()
+            table[name].add(value)
+
+    def snapshot(self, reset: bool = False) -> dict:
+        with self.lock:
+            data = {
+                "counters": dict(self.counters),
+                "timers": {name: h.to_dict() for name, h in self.timers.items()},
+                "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+            }
+            if reset:
+                self.reset()
+            return data
+
+    def merge(self, snapshot: dict):
+        with self.lock:
+            for name, n in snapshot["counters"].items():
+                self.counters[name] = self.counters.get(name, 0) + n
+            for section, table in (("timers", self.timers), ("histograms", self.histograms)):
+                for name, data in snapshot[section].items():
+                    if data["count"]:
+                        table.setdefault(name, Histogram()).merge(data)
+
+
+class _Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        add_time(self.name, time.perf_counter() - self.start)
+
+
+class _NullTimer:
+    """
+    Temporizador vacío que se usa con la instrumentación desactivada.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class LogSink:
+    """
+    Escribe cada reporte en un logger (una línea por métrica).
+    """
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("chord_progression_generator")
+        self.level = level
+
+    def write(self, report: dict):
+        stage = report["stage"]
+        for name, n in report["counters"].items():
+            self.logger.log(self.level, "[%s] %s = %d", stage, name, n)
+        for name, t in report["timers"].items():
+            self.logger.log(self.level, "[%s] %s: %d x %.6fs (total %.3fs, max %.6fs)",
+                            stage, name, t["count"], t["mean"], t["total"], t["max"])
+        for name, h in report["histograms"].items():
+            self.logger.log(self.level, "[%s] %s: %d valores, media %.4g (min %.4g, max %.4g)",
+                            stage, name, h["count"], h["mean"], h["min"], h["max"])
+
+
+class JsonFileSink:
+    """
+    Añade cada reporte como una línea JSON a un archivo.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def write(self, report: dict):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(report) + "\n")
+
+
+class CallbackSink:
+    """
+    Llama a una función con cada reporte (dict).
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def write(self, report: dict):
+        self.callback(report)
+
+
+def enable(*sinks):
+    """
+    Activa la instrumentación (descartando métricas previas).
+
+    :param sinks: Destinos de los reportes (LogSink, JsonFileSink, CallbackSink o
+                  cualquier objeto con write(report)). Sin sinks, las métricas se
+                  consultan con snapshot().
+    """
+    global _registry
+    _registry = _Registry(sinks)
+
+
+def disable():
+    global _registry
+    _registry = None
+
+
+def enabled() -> bool:
+    return _registry is not None
+
+
+def count(name: str, n: int = 1):
+    """
+    Suma n al contador `name` (ej. 'render.failed').
+    """
+    if _registry is not None:
+        _registry.count(name, n)
+
+
+def observe(name: str, value: float):
+    """
+    Añade un valor al histograma `name` (ej. bytes de cada archivo).
+    """
+    if _registry is not None:
+        _registry.observe(_registry.histograms, name, value)
+
+
+def add_time(name: str, seconds: float):
+    """
+    Añade una duración ya medida (en segundos) al temporizador `name`.
+    """
+    if _registry is not None:
+        _registry.observe(_registry.timers, name, seconds)
+
+
+def timer(name: str):
+    """
+    Context manager que mide el bloque y lo añade al temporizador `name`:
+        with instrumentation.timer("generate.write_file"):
+            ...
+    """
+    if _registry is None:
+        return _NULL_TIMER
+    return _Timer(name)
+
+
+def snapshot() -> dict:
+    """
+    Métricas acumuladas desde el último flush ({} si está desactivada).
+    """
+    if _registry is None:
+        return {}
+    return _registry.snapshot()
+
+
+def merge(data: dict):
+    """
+    Suma un snapshot (ej. el de un proceso hijo) a las métricas actuales.
+    """
+    if _registry is not None and data:
+        _registry.merge(data)
+
+
+def flush(stage: str) -> dict:
+    """
+    Envía a los sinks el reporte de la etapa con las métricas acumuladas y
+    las reinicia.
+
+    :param stage: Nombre de la etapa (ej. 'generate', 'render', 'jams').
+    :return: El reporte enviado ({} si está desactivada).
+    """
+    registry = _registry
+    if registry is None:
+        return {}
+    report = {"stage": stage, "timestamp": time.time(), **registry.snapshot(reset=True)}
+    for sink in registry.sinks:
+        sink.write(report)
+    return report
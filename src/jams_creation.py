@@ -1,39 +1,43 @@
 #!/usr/bin/env python
 
+import io
 import jams
 import json
+import os
+import time
+from functools import lru_cache
 from pathlib import Path
 
 from .config import JAMS_DIR
 from .roman_to_chord import roman_to_chord_label
+from .chord_theory import THEORY_VERSION
+from .build_cache import BuildManifest, artifact_hash, atomic_write, temp_path
+from .metadata import METADATA_NAME, MetadataIndex
+from .durations_store import DurationsStore
+from .layout import artifact_relpath, file_relpath, folder_artifacts
+from . import instrumentation
 
-def create_jams_file(
+@lru_cache(maxsize=4096)
+def resolve_chord_labels(roman_sequence: tuple, key: str) -> tuple:
+    """
+    Etiquetas JAMS de una secuencia de numerales en una tonalidad. Memoizada:
+    las etiquetas solo dependen de (numerales, tonalidad), no de cada archivo.
+    """
+    return tuple(roman_to_chord_label(roman, key) for roman in roman_sequence)
+
+def build_jams(
     roman_sequence: list,
     key: str,
-    jam_name: str,
     progression_name: str = "",
     durations: list[float] = None
-) -> Path:
+) -> jams.JAMS:
     """
-    Genera un archivo .jams a partir de una secuencia de acordes dada en 
-    notación de numerales romanos (por ej. ["ii7", "V7", "Imaj7"]) y una tonalidad.
-    Usa 'roman_to_chord_label' para obtener la etiqueta 
-    oficial JAMS (p. ej. "D:min7", "G:7", "C:maj7").
-
-    :param roman_sequence: Lista de numerales romanos (strings).
-                           Ej: ["ii7", "V7", "Imaj7"]
-    :param key: Tonalidad. Ej: "C"
-    :param jam_name: Nombre base del archivo .jams
-    :param progression_name: Nombre de la progresión (guarda en metadatos)
-    :param duration_per_chord: Duración en segundos de cada acorde.
-    :return: Path al archivo .jams creado.
-    
-    Sus duraciones reales son tomadas del archivo durations.json. Si no se pasan duraciones, se usa 2.0s por defecto.
+    Construye en memoria el objeto JAMS de una progresión (ver create_jams_file).
     """
     jam = jams.JAMS()
     chord_annotation = jams.Annotation(namespace='chord')
 
-    chord_labels = [roman_to_chord_label(roman, key) for roman in roman_sequence]
+    chord_labels = resolve_chord_labels(tuple(roman_sequence), key)
 
     start_time = 0.0
     for i, chord_lab in enumerate(chord_labels):
@@ -55,37 +59,288 @@ def create_jams_file(
 
     jam.file_metadata.title = progression_name
     jam.file_metadata.duration = start_time
+    return jam
+
+def jams_to_bytes(jam: jams.JAMS) -> bytes:
+    """
+    Serializa (y valida) un JAMS igual que jam.save, pero a bytes en memoria.
+    """
+    buffer = io.StringIO()
+    jam.save(buffer)
+    return buffer.getvalue().encode("utf-8")
+
+def create_jams_file(
+    roman_sequence: list,
+    key: str,
+    jam_name: str,
+    progression_name: str = "",
+    durations: list[float] = None
+) -> Path:
+    """
+    Genera un archivo .jams a partir de una secuencia de acordes dada en 
+    notación de numerales romanos (por ej. ["ii7", "V7", "Imaj7"]) y una tonalidad.
+    Usa 'roman_to_chord_label' para obtener la etiqueta 
+    oficial JAMS (p. ej. "D:min7", "G:7", "C:maj7").
+
+    :param roman_sequence: Lista de numerales romanos (strings).
+                           Ej: ["ii7", "V7", "Imaj7"]
+    :param key: Tonalidad. Ej: "C"
+    :param jam_name: Nombre base del archivo .jams (o su ruta relativa a JAMS_DIR,
+                     sin extensión; ver layout.py)
+    :param progression_name: Nombre de la progresión (guarda en metadatos)
+    :param duration_per_chord: Duración en segundos de cada acorde.
+    :return: Path al archivo .jams creado.
+    
+    Sus duraciones reales son tomadas del archivo durations.json. Si no se pasan duraciones, se usa 2.0s por defecto.
+    """
+    with instrumentation.timer("jams.build"):
+        jam = build_jams(roman_sequence, key, progression_name, durations)
 
     jam_path = JAMS_DIR / f"{jam_name}.jams"
     jam_path.parent.mkdir(parents=True, exist_ok=True)
-    jam.save(str(jam_path))
+    # jam.save valida contra el esquema antes de escribir; se escribe en un
+    # temporal que se renombra al terminar, para no dejar .jams a medias
+    tmp_path = temp_path(jam_path)
+    try:
+        with instrumentation.timer("jams.validate_and_save"):
+            jam.save(str(tmp_path), fmt="jams")
+        os.replace(tmp_path, jam_path)
+        if instrumentation.enabled():
+            instrumentation.observe("jams.file_bytes", jam_path.stat().st_size)
+    finally:
+        tmp_path.unlink(missing_ok=True)
     return jam_path
 
-def create_jams_for_folder(folder: Path, roman_sequence: list, key: str, progression_name: str):
+def jams_template(roman_sequence: list, key: str, progression_name: str = "") -> dict:
+    """
+    Estructura JSON de un .jams (la de jam.save) para una progresión y tonalidad,
+    construida una sola vez para rellenarla luego con fill_jams_template.
+    """
+    return build_jams(roman_sequence, key, progression_name).__json__
+
+def fill_jams_template(template: dict, durations: list[float] = None) -> dict:
+    """
+    Copia la plantilla con las duraciones de un archivo, sin reconstruir ni
+    revalidar el objeto JAMS. Produce el mismo JSON que build_jams.
+    """
+    annotation = template["annotations"][0]
+    labels = [obs["value"] for obs in annotation["data"]]
+
+    data = []
+    start_time = 0.0
+    for i, chord_lab in enumerate(labels):
+        dur = durations[i] if durations and i < len(durations) else 2.0
+        data.append({"time": start_time, "duration": dur, "value": chord_lab, "confidence": None})
+        start_time += dur
+
+    sandbox = dict(annotation["sandbox"])
+    sandbox["durations"] = durations if durations else [2.0] * len(labels)
+    annotation = dict(annotation, data=data, sandbox=sandbox)
+    file_metadata = dict(template["file_metadata"], duration=start_time)
+    return dict(template, annotations=[annotation], file_metadata=file_metadata)
+
+def jams_digest(roman_sequence: list, key: str, progression_name: str, durations: list) -> str:
+    """
+    Hash de entrada de un .jams para el manifiesto incremental de JAMS_DIR.
+    """
+    return artifact_hash(
+        kind="jams", roman_sequence=roman_sequence, key=key,
+        progression_name=progression_name, durations=durations, theory=THEORY_VERSION
+    )
+
+def _file_lookup(folder: Path, key: str = None):
+    """
+    Retorna una función mf -> (tonalidad, duraciones, ruta del .jams relativa a
+    JAMS_DIR) para los .mid de la carpeta.
+
+    Con metadata.npz, cada archivo se resuelve por su id en O(1): su tonalidad
+    es su propia tónica (salvo que se fije `key`) y la ruta sale de su tónica y
+    octava. Sin él, se usan las duraciones de durations.jsonl (o del
+    durations.json antiguo), la tonalidad `key` para toda la carpeta y la ruta
+    que se deduce del nombre del .mid (layout.file_relpath).
+    """
+    if MetadataIndex.exists(folder):
+        index = MetadataIndex(folder)
+
+        def lookup(mf):
+            i = index.row(mf.name)
+            file_key = index.key(i)
+            relpath = artifact_relpath(folder.name, mf.name, file_key, int(index.octave[i]), ".jams")
+            return key or file_key, index.durations[i].tolist(), relpath
+        return lookup
+
+    if key is None:
+        raise ValueError(f"[create_jams_for_folder] {folder} no tiene {METADATA_NAME}: hay que indicar la tonalidad")
+
+    store = DurationsStore(folder)
+
+    def lookup(mf):
+        return key, store.get(mf.name, None), file_relpath(mf, ".jams")
+    return lookup
+
+def create_jams_for_folder(
+    folder: Path,
+    roman_sequence: list,
+    key: str = None,
+    progression_name: str = "",
+    incremental: bool = True,
+    batch: bool = False,
+    validate_sample: bool = True,
+    jsonl_path: Path = None
+):
+    """
+    Crea un .jams por cada .mid de la carpeta, con sus duraciones reales.
+
+    :param key: Tonalidad. Si es None, cada archivo usa su tónica según el
+                metadata.npz de la carpeta (escrito por generate_progression).
+    :param incremental: Si es True, omite los .jams al día según el manifest.json de
+                        JAMS_DIR (numerales, tonalidad, título y duraciones).
+    :param batch: Si es True, la estructura JAMS se construye una sola vez por
+                  tonalidad y cada archivo se escribe rellenando la plantilla, sin
+                  crear ni validar un objeto jams.JAMS por archivo.
+    :param validate_sample: En modo batch, construye y valida con jams el primer
+                            archivo del lote y verifica que la plantilla coincide.
+    :param jsonl_path: En modo batch, escribe todas las anotaciones en un único
+                       archivo JSONL ({"id": ..., "jams": {...}} por línea) en lugar
+                       de un .jams por archivo (no usa el manifiesto).
+    """
     if not folder.exists():
         print(f"No existe la carpeta {folder}")
         return
 
-    mid_files = list(folder.rglob("*.mid"))
-    if not mid_files:
+    # Los .mid y las rutas de sus .jams (según OUTPUT_LAYOUT) salen de metadata.npz
+    jam_paths = folder_artifacts(folder, ".jams")
+    if not jam_paths:
         print(f"No hay archivos .mid en {folder}")
         return
 
-    durations_path = folder / "durations.json"
-    if durations_path.exists():
-        with open(durations_path, "r") as f:
-            durations_dict = json.load(f)
-    else:
-        durations_dict = {}
+    started = time.perf_counter()
+    lookup = _file_lookup(folder, key)
 
-    for mf in mid_files:
-        base_name = mf.stem
-        durations = durations_dict.get(f"{base_name}.mid", None)
+    if batch:
+        _create_jams_batch(jam_paths, lookup, roman_sequence, progression_name,
+                           incremental, validate_sample, jsonl_path)
+        instrumentation.add_time("jams.total", time.perf_counter() - started)
+        instrumentation.flush("jams")
+        return
+
+    manifest = BuildManifest(JAMS_DIR)
+    skipped = 0
+    for mf, relpath in jam_paths.items():
+        file_key, durations, _ = lookup(mf)
+        digest = jams_digest(roman_sequence, file_key, progression_name, durations)
+        if incremental and manifest.is_fresh(relpath.as_posix(), digest):
+            skipped += 1
+            instrumentation.count("jams.skipped")
+            continue
         jam_path = create_jams_file(
             roman_sequence=roman_sequence,
-            key=key,
-            jam_name=base_name,
+            key=file_key,
+            jam_name=relpath.with_suffix("").as_posix(),
             progression_name=progression_name,
             durations=durations
         )
+        manifest.record(relpath.as_posix(), digest)
+        instrumentation.count("jams.written")
         print(f"Creado .jams: {jam_path}")
+    manifest.save()
+
+    instrumentation.add_time("jams.total", time.perf_counter() - started)
+    instrumentation.flush("jams")
+    if skipped:
+        print(f"{skipped} .jams ya estaban al día en {JAMS_DIR}")
+
+def _create_jams_batch(jam_paths, lookup, roman_sequence, progression_name,
+                       incremental, validate_sample, jsonl_path):
+    templates = {}
+    manifest = BuildManifest(JAMS_DIR) if jsonl_path is None else None
+    jsonl = None
+    if jsonl_path is not None:
+        Path(jsonl_path).parent.mkdir(parents=True, exist_ok=True)
+        jsonl = open(jsonl_path, "w")
+    else:
+        JAMS_DIR.mkdir(parents=True, exist_ok=True)
+
+    written = 0
+    skipped = 0
+    validated = not validate_sample
+    try:
+        for mf, relpath in jam_paths.items():
+            base_name = mf.stem
+            key, durations, _ = lookup(mf)
+            if jsonl is None:
+                digest = jams_digest(roman_sequence, key, progression_name, durations)
+                jam_name = relpath.as_posix()
+                if incremental and manifest.is_fresh(jam_name, digest):
+                    skipped += 1
+                    continue
+
+            if key not in templates:
+                with instrumentation.timer("jams.template"):
+                    templates[key] = jams_template(roman_sequence, key, progression_name)
+            with instrumentation.timer("jams.fill_template"):
+                doc = fill_jams_template(templates[key], durations)
+
+            if not validated:
+                # Un archivo por lote (el primero que se escribe) pasa por jams
+                # completo, con validación
+                with instrumentation.timer("jams.validate_sample"):
+                    reference = build_jams(roman_sequence, key, progression_name, durations)
+                    reference.validate()
+                if reference.__json__ != doc:
+                    raise ValueError(
+                        f"[create_jams_for_folder] La plantilla batch no coincide con jams para {base_name}"
+                    )
+                validated = True
+
+            if jsonl is not None:
+                line = json.dumps({"id": base_name, "jams": doc}) + "\n"
+                with instrumentation.timer("jams.write"):
+                    jsonl.write(line)
+                instrumentation.observe("jams.file_bytes", len(line))
+                written += 1
+                continue
+
+            text = json.dumps(doc, indent=2)
+            with instrumentation.timer("jams.write"):
+                (JAMS_DIR / relpath).parent.mkdir(parents=True, exist_ok=True)
+                atomic_write(JAMS_DIR / relpath, text)
+            instrumentation.observe("jams.file_bytes", len(text))
+            manifest.record(jam_name, digest)
+            written += 1
+    finally:
+        if jsonl is not None:
+            jsonl.close()
+    if manifest is not None:
+        manifest.save()
+
+    instrumentation.count("jams.written", written)
+    instrumentation.count("jams.skipped", skipped)
+
+    target = jsonl_path if jsonl_path is not None else JAMS_DIR
+    print(f"Creados {written} .jams en {target} ({skipped} ya al día)")
+
+def write_jams_files(folder: Path, mid_names: list, roman_sequence: list, key: str = None,
+                     progression_name: str = "") -> list:
+    """
+    Escribe los .jams de algunos .mid de una carpeta rellenando plantillas (como
+    el modo batch), sin tocar el manifiesto (lo registra quien la llama). Es la
+    unidad de trabajo de anotación del catálogo.
+
+    :param folder: Carpeta de los .mid (con metadata.npz, o indicar `key`).
+    :param mid_names: Nombres de los .mid (ej. 'C-2-ii7-V7-I-0.mid').
+    :return: Lista de (ruta del .jams relativa a JAMS_DIR, hash de entrada).
+    """
+    folder = Path(folder)
+    lookup = _file_lookup(folder, key)
+    templates = {}
+    results = []
+    for mid_name in mid_names:
+        file_key, durations, relpath = lookup(folder / mid_name)
+        if file_key not in templates:
+            templates[file_key] = jams_template(roman_sequence, file_key, progression_name)
+        doc = fill_jams_template(templates[file_key], durations)
+        (JAMS_DIR / relpath).parent.mkdir(parents=True, exist_ok=True)
+        atomic_write(JAMS_DIR / relpath, json.dumps(doc, indent=2))
+        results.append((relpath.as_posix(), jams_digest(roman_sequence, file_key, progression_name, durations)))
+    return results
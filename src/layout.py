@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+
+"""
+Módulo: layout
+--------------
+Rutas de los .wav y .jams dentro de WAV_DIR / JAMS_DIR según OUTPUT_LAYOUT
+(config.py):
+
+- 'flat':   WAV_DIR/<stem>.wav. Todas las progresiones en una sola carpeta
+            (el formato original; dos progresiones pueden chocar por nombre).
+- 'mirror': WAV_DIR/<progresión>/<tónica><octava>/<stem>.wav, la misma
+            jerarquía que la generación, con carpetas de unos cientos de archivos.
+- 'hashed': WAV_DIR/<progresión>/<hh>/<stem>.wav, con <hh> los dos primeros
+            dígitos hex del hash del nombre (256 carpetas por progresión).
+
+Las rutas se calculan a partir de la progresión (carpeta de los .mid), la
+tónica y la octava de cada archivo, que salen de metadata.npz: no hace falta
+listar ninguna carpeta.
+"""
+
+import hashlib
+from pathlib import Path
+
+from .config import OUTPUT_LAYOUT
+from .metadata import MetadataIndex
+
+LAYOUTS = ("flat", "mirror", "hashed")
+
+
+def _check_layout(layout: str) -> str:
+    layout = layout or OUTPUT_LAYOUT
+    if layout not in LAYOUTS:
+        raise ValueError(f"[layout] Organización no reconocida: {layout} (opciones: {', '.join(LAYOUTS)})")
+    return layout
+
+
+def artifact_relpath(progression: str, filename: str, key: str, octave: int, suffix: str,
+                     layout: str = None) -> Path:
+    """
+    Ruta, relativa a WAV_DIR / JAMS_DIR, del artefacto de un .mid.
+
+    :param progression: Nombre de la progresión (carpeta de los .mid).
+    :param filename: Nombre del .mid (ej. 'C-2-ii7-V7-Imaj7-0.mid').
+    :param key: Tónica del archivo (ej. 'C').
+    :param octave: Octava de la tónica.
+    :param suffix: Extensión del artefacto ('.wav' o '.jams').
+    :param layout: 'flat', 'mirror' o 'hashed' (por defecto OUTPUT_LAYOUT).
+    :return: Ruta relativa (ej. 'ii7-V7-Imaj7/C2/C-2-ii7-V7-Imaj7-0.wav').
+    """
+    layout = _check_layout(layout)
+    name = Path(filename).stem + suffix
+    if layout == "flat":
+        return Path(name)
+    if layout == "mirror":
+        return Path(progression, f"{key}{octave}", name)
+    bucket = hashlib.sha1(Path(filename).stem.encode("utf-8")).hexdigest()[:2]
+    return Path(progression, bucket, name)
+
+
+def file_relpath(midi_file: Path, suffix: str, layout: str = None) -> Path:
+    """
+    Ruta relativa del artefacto de un solo .mid, sin metadata.npz: la progresión
+    es su carpeta y la tónica y la octava salen del nombre ('<tónica>-<octava>-...').
+    """
+    midi_file = Path(midi_file)
+    key, octave = (midi_file.stem.split("-") + ["", ""])[:2]
+    return artifact_relpath(midi_file.parent.name, midi_file.name, key, octave, suffix, layout)
+
+
+def folder_artifacts(folder: Path, suffix: str, layout: str = None) -> dict:
+    """
+    Artefactos de todos los .mid de una carpeta de progresión.
+
+    Con metadata.npz, los .mid y sus tónicas se leen del índice (en el orden de
+    generación) sin listar la carpeta; en carpetas antiguas se buscan los .mid.
+
+    :return: {ruta del .mid: ruta relativa del artefacto}
+    """
+    folder = Path(folder)
+    layout = _check_layout(layout)
+    if not MetadataIndex.exists(folder):
+        return {mf: file_relpath(mf, suffix, layout) for mf in sorted(folder.rglob("*.mid"))}
+    index = MetadataIndex(folder)
+    keys = [index.note_names[pc] for pc in index.root_pc.tolist()]
+    return {
+        folder / filename: artifact_relpath(folder.name, filename, key, octave, suffix, layout)
+        for filename, key, octave in zip(index.filenames.tolist(), keys, index.octave.tolist())
+    }
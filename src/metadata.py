@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+
+"""
+Módulo: metadata
+----------------
+Índice columnar de metadatos de generación (`metadata.npz`), escrito por
+generate_progression junto a los .mid. Guarda por archivo la tónica (clase de
+altura y octava), la tupla de inversiones y, por acorde, las notas MIDI,
+velocities y duraciones (en pulsos), en arrays de NumPy, además del tempo
+(BPM) con el que se escribieron los .mid.
+
+Así las etapas de anotación y análisis consultan cualquier archivo por su id
+(fila) en O(1), sin parsear nombres de archivo ni cargar diccionarios JSON.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+from .config import DEFAULT_TEMPO
+
+METADATA_NAME = "metadata.npz"
+PAD = -1  # relleno de notas/velocities en acordes con menos notas que el máximo
+
+
+def voicing_columns(voicings: list, num_chords: int, max_chord_size: int, note_names: list) -> dict:
+    """
+    Convierte una lista de Voicing en columnas (un array por campo).
+
+    :param voicings: Voces generadas (ver generate_progression.Voicing).
+    :param num_chords: Acordes por progresión.
+    :param max_chord_size: Máximo de notas por acorde (ancho de las columnas de notas).
+    :param note_names: Nombres de las clases de altura (NOTE_ARRAY), para obtener root_pc.
+    :return: {campo: array} con una fila por voz.
+    """
+    n = len(voicings)
+    notes = np.full((n, num_chords, max_chord_size), PAD, dtype=np.int16)
+    velocities = np.full((n, num_chords, max_chord_size), PAD, dtype=np.int16)
+    for row, voicing in enumerate(voicings):
+        counts = [0] * num_chords
+        chord = -1
+        last_start = None
+        for pitch, start, _, velocity in voicing.notes:
+            if start != last_start:
+                chord += 1
+                last_start = start
+            notes[row, chord, counts[chord]] = pitch
+            velocities[row, chord, counts[chord]] = velocity
+            counts[chord] += 1
+    return {
+        "filenames": np.array([v.filename for v in voicings], dtype=np.str_),
+        "root_pc": np.array([note_names.index(v.key) for v in voicings], dtype=np.int8),
+        "octave": np.array([v.octave for v in voicings], dtype=np.int8),
+        "inversions": np.array([v.inversions for v in voicings], dtype=np.int8).reshape(n, num_chords),
+        "notes": notes,
+        "velocities": velocities,
+        "durations": np.array([v.durations for v in voicings], dtype=np.float64).reshape(n, num_chords),
+    }
+
+
+def save_metadata(folder: Path, chunks: list, progression: str, name: str, note_names: list,
+                  tempo: int = DEFAULT_TEMPO) -> Path:
+    """
+    Concatena bloques de columnas (en orden) y los guarda en folder/metadata.npz,
+    junto con el tempo (BPM) de los .mid.
+    """
+    columns = {
+        field: np.concatenate([chunk[field] for chunk in chunks])
+        for field in chunks[0]
+    }
+    path = Path(folder) / METADATA_NAME
+    np.savez(
+        path,
+        progression=np.array(progression),
+        name=np.array(name),
+        tempo=np.array(tempo),
+        note_names=np.array(note_names, dtype=np.str_),
+        **columns
+    )
+    return path
+
+
+class MetadataIndex:
+    """
+    Lector del índice de metadatos de una carpeta de progresión.
+    Las columnas son arrays accesibles directamente (ej. index.durations[i]).
+
+    :param folder: Carpeta con metadata.npz (la de los .mid).
+    """
+
+    def __init__(self, folder: Path):
+        with np.load(Path(folder) / METADATA_NAME) as data:
+            self.progression = str(data["progression"])
+            self.name = str(data["name"])
+            # Los índices anteriores al tempo se escribieron con el de por defecto
+            self.tempo = float(data["tempo"]) if "tempo" in data else float(DEFAULT_TEMPO)
+            self.note_names = [str(n) for n in data["note_names"]]
+            self.filenames = data["filenames"]
+            self.root_pc = data["root_pc"]
+            self.octave = data["octave"]
+            self.inversions = data["inversions"]
+            self.notes = data["notes"]
+            self.velocities = data["velocities"]
+            self.durations = data["durations"]
+        self._rows = {str(f): i for i, f in enumerate(self.filenames)}
+
+    @staticmethod
+    def exists(folder: Path) -> bool:
+        return (Path(folder) / METADATA_NAME).exists()
+
+    def __len__(self):
+        return len(self.filenames)
+
+    @property
+    def seconds_per_beat(self) -> float:
+        """
+        Segundos por pulso: las duraciones están en pulsos, el audio en segundos.
+        """
+        return 60.0 / self.tempo
+
+    def row(self, filename: str) -> int:
+        """
+        Id (fila) de un archivo, por nombre con o sin extensión .mid.
+        """
+        if not filename.endswith(".mid"):
+            filename = f"{filename}.mid"
+        return self._rows[filename]
+
+    def key(self, i: int) -> str:
+        """
+        Tonalidad (nombre de la tónica) del archivo i.
+        """
+        return self.note_names[self.root_pc[i]]
+
+    def chord_notes(self, i: int, chord: int) -> list:
+        """
+        Notas MIDI del acorde `chord` del archivo i (sin relleno).
+        """
+        row = self.notes[i, chord]
+        return row[row != PAD].tolist()
+
+    def record(self, i: int) -> dict:
+        """
+        Todos los metadatos del archivo i como diccionario.
+        """
+        num_chords = self.durations.shape[1]
+        return {
+            "filename": str(self.filenames[i]),
+            "key": self.key(i),
+            "octave": int(self.octave[i]),
+            "inversions": tuple(self.inversions[i].tolist()),
+            "notes": [self.chord_notes(i, c) for c in range(num_chords)],
+            "velocities": [
+                [v for v in self.velocities[i, c].tolist() if v != PAD] for c in range(num_chords)
+            ],
+            "durations": self.durations[i].tolist(),
+        }
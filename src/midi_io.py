@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+
+"""
+Módulo: midi_io
+---------------
+Lectura y escritura mínimas de archivos MIDI estándar (SMF) sin depender de
+librerías externas: `read_midi_notes` obtiene las notas (pitch, inicio,
+duración, velocity) y `encode_midi` serializa una lista de notas directamente
+a bytes. Pensado para los archivos pequeños que produce generate_progression.
+"""
+
+import struct
+from functools import lru_cache
+from pathlib import Path
+
+DEFAULT_MICROSECONDS_PER_BEAT = 500000  # 120 BPM, valor por defecto del estándar
+TICKS_PER_BEAT = 960  # división que usa midiutil por defecto
+_END_OF_TRACK = b"\x00\xff\x2f\x00"
+
+
+def _read_varlen(data: bytes, pos: int) -> tuple:
+    """
+    Lee una cantidad de longitud variable (VLQ) y retorna (valor, nueva_posición).
+    """
+    value = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if not byte & 0x80:
+            return value, pos
+
+
+def _parse_track(data: bytes) -> list:
+    """
+    Retorna la lista de eventos de una pista como tuplas
+    (tick_absoluto, tipo, datos), con tipo 'on', 'off' o 'tempo'.
+    """
+    events = []
+    pos = 0
+    tick = 0
+    status = None
+    while pos < len(data):
+        delta, pos = _read_varlen(data, pos)
+        tick += delta
+        byte = data[pos]
+        if byte & 0x80:
+            status = byte
+            pos += 1
+        elif status is None:
+            raise ValueError("[midi_io] Evento sin byte de estado")
+
+        if status == 0xFF:
+            meta_type = data[pos]
+            length, pos = _read_varlen(data, pos + 1)
+            payload = data[pos:pos + length]
+            pos += length
+            if meta_type == 0x51:
+                events.append((tick, "tempo", int.from_bytes(payload, "big")))
+            elif meta_type == 0x2F:
+                break
+        elif status in (0xF0, 0xF7):
+            length, pos = _read_varlen(data, pos)
+            pos += length
+        else:
+            kind = status & 0xF0
+            if kind in (0xC0, 0xD0):
+                pos += 1
+                continue
+            pitch, velocity = data[pos], data[pos + 1]
+            pos += 2
+            if kind == 0x90 and velocity > 0:
+                events.append((tick, "on", (pitch, velocity)))
+            elif kind in (0x80, 0x90):
+                events.append((tick, "off", (pitch, velocity)))
+    return events
+
+
+def read_midi_notes(midi_file: Path) -> list:
+    """
+    Lee un archivo .mid y retorna sus notas ordenadas por inicio.
+
+    :param midi_file: Ruta al archivo .mid.
+    :return: Lista de tuplas (pitch, inicio_seg, duración_seg, velocity).
+    """
+    data = Path(midi_file).read_bytes()
+    if data[:4] != b"MThd":
+        raise ValueError(f"[midi_io] No es un archivo MIDI: {midi_file}")
+    header_len = struct.unpack(">I", data[4:8])[0]
+    _, num_tracks, division = struct.unpack(">HHH", data[8:14])
+    if division & 0x8000:
+        raise ValueError(f"[midi_io] División SMPTE no soportada: {midi_file}")
+
+    events = []
+    pos = 8 + header_len
+    for _ in range(num_tracks):
+        chunk_len = struct.unpack(">I", data[pos + 4:pos + 8])[0]
+        if data[pos:pos + 4] == b"MTrk":
+            events.extend(_parse_track(data[pos + 8:pos + 8 + chunk_len]))
+        pos += 8 + chunk_len
+
+    # Orden estable por tick; en un mismo tick los cambios de tempo van primero
+    order = {"tempo": 0, "off": 1, "on": 2}
+    events.sort(key=lambda e: (e[0], order[e[1]]))
+
+    notes = []
+    active = {}
+    seconds = 0.0
+    last_tick = 0
+    tempo = DEFAULT_MICROSECONDS_PER_BEAT
+    for tick, kind, payload in events:
+        seconds += (tick - last_tick) * tempo / (division * 1e6)
+        last_tick = tick
+        if kind == "tempo":
+            tempo = payload
+        elif kind == "on":
+            active.setdefault(payload[0], []).append((seconds, payload[1]))
+        else:
+            started = active.get(payload[0])
+            if started:
+                onset, velocity = started.pop(0)
+                notes.append((payload[0], onset, seconds - onset, velocity))
+
+    notes.sort(key=lambda n: (n[1], n[0]))
+    return notes
+
+
+def _varlen(value: int) -> bytes:
+    """
+    Codifica un entero como cantidad de longitud variable (VLQ).
+    """
+    if value < 0x80:
+        return bytes((value,))
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(out))
+
+
+@lru_cache(maxsize=64)
+def _file_prefix(tempo, ticks_per_beat: int) -> bytes:
+    """
+    Cabecera MThd (formato 1, dos pistas) más la pista de tempo completa. Es
+    igual para todos los archivos con el mismo tempo, así que se construye una
+    sola vez y el resto del archivo se concatena a continuación.
+    """
+    header = b"MThd" + struct.pack(">IHHH", 6, 1, 2, ticks_per_beat)
+    tempo_track = b"\x00\xff\x51\x03" + int(60000000 / tempo).to_bytes(3, "big") + _END_OF_TRACK
+    return header + b"MTrk" + struct.pack(">I", len(tempo_track)) + tempo_track
+
+
+def encode_midi(notes, tempo=60, ticks_per_beat: int = TICKS_PER_BEAT) -> bytes:
+    """
+    Serializa notas a un archivo MIDI (canal 0) con la misma disposición de
+    bytes que MIDIFile(1) de midiutil: pista de tempo y pista de notas, ticks
+    truncados como int(beats * división), en cada tick los note-off antes que
+    los note-on y, a igualdad, en el orden de las notas.
+
+    :param notes: Iterable de (pitch, inicio_beats, duración_beats, velocity).
+    :param tempo: Tempo en BPM.
+    :param ticks_per_beat: División (ticks por negra).
+    :return: Bytes del archivo .mid.
+    """
+    events = []
+    seen = set()
+    for order, (pitch, start, duration, velocity) in enumerate(notes):
+        tick = int(start * ticks_per_beat)
+        off_tick = tick + int(duration * ticks_per_beat)
+        # midiutil descarta los eventos repetidos (mismo tipo, tick y pitch)
+        for kind, event_tick, status in ((1, tick, 0x90), (0, off_tick, 0x80)):
+            if (kind, event_tick, pitch) not in seen:
+                seen.add((kind, event_tick, pitch))
+                events.append((event_tick, kind, order, status, pitch, velocity))
+    events.sort()
+
+    # Desentrelazado de midiutil: si una nota se solapa con otra del mismo pitch,
+    # el note-off se mueve al último note-on pendiente de ese pitch
+    pending = {}
+    for i, (tick, kind, order, status, pitch, velocity) in enumerate(events):
+        stack = pending.setdefault(pitch, [])
+        if kind:
+            stack.append(tick)
+        elif len(stack) > 1:
+            events[i] = (stack.pop(), kind, order, status, pitch, velocity)
+        else:
+            stack.pop()
+    events.sort()
+
+    track = bytearray()
+    last_tick = 0
+    for tick, _, _, status, pitch, velocity in events:
+        track += _varlen(tick - last_tick)
+        track += bytes((status, pitch, velocity))
+        last_tick = tick
+    track += _END_OF_TRACK
+    return _file_prefix(tempo, ticks_per_beat) + b"MTrk" + struct.pack(">I", len(track)) + bytes(track)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+
+"""
+Módulo: pipeline
+----------------
+Pipeline en una sola pasada: generar -> renderizar -> anotar.
+
+Cada voz sale de `iter_voicings` como evento en memoria y atraviesa tres
+etapas productor/consumidor conectadas por colas acotadas, de modo que la
+memoria se mantiene constante aunque la progresión tenga miles de archivos.
+Los .mid intermedios son opcionales.
+"""
+
+import os
+import queue
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from .config import (
+    MIDI_DIR, WAV_DIR, DEFAULT_TEMPO, DEFAULT_SAMPLE_RATE,
+    DEFAULT_MAX_WORKERS, DEFAULT_RENDER_BACKEND
+)
+from .generate_progression import iter_voicings, resolve_seed, voicing_to_midi_bytes
+from .audio_conversion import RENDER_BACKENDS
+from .build_cache import temp_path
+from .layout import artifact_relpath
+from .jams_creation import build_jams, create_jams_file, jams_to_bytes
+from .shards import ShardWriter
+from .durations_store import DurationsWriter
+from .synth import encode_wav, read_wav, render_notes, write_wav
+from .corpus import AudioCorpusWriter
+from .roman_to_chord import roman_to_chord_label
+from . import instrumentation
+
+_DONE = object()  # centinela de fin de etapa
+
+
+def _render_voicing(voicing, midi_file, tempo, sample_rate, backend,
+                    to_shards=False, keep_audio=False, name="") -> tuple:
+    """
+    Renderiza una voz y retorna (código de salida del backend, bytes del WAV, audio).
+    Sin shards, el WAV se escribe en WAV_DIR (en la ruta que da OUTPUT_LAYOUT para
+    la progresión `name`) y los bytes son None; el audio (buffer float) solo se
+    retorna con keep_audio=True.
+
+    El backend 'synth' usa las notas en memoria; los demás necesitan un .mid,
+    que se escribe de forma temporal si no se pidió conservarlo.
+    """
+    stem = Path(voicing.filename).stem
+    wav_path = WAV_DIR / artifact_relpath(name, voicing.filename, voicing.key, voicing.octave, ".wav")
+
+    if backend == "synth":
+        seconds_per_beat = 60.0 / tempo
+        notes = [
+            (pitch, start * seconds_per_beat, dur * seconds_per_beat, velocity)
+            for pitch, start, dur, velocity in voicing.notes
+        ]
+        audio = render_notes(notes, sample_rate)
+        wav_data = None
+        if to_shards:
+            wav_data = encode_wav(audio, sample_rate)
+        else:
+            write_wav(wav_path, audio, sample_rate)
+        return 0, wav_data, audio if keep_audio else None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if midi_file is None:
+            midi_file = Path(tmp) / voicing.filename
+            midi_file.write_bytes(voicing_to_midi_bytes(voicing, tempo))
+        wav_file = Path(tmp) / f"{stem}.wav" if to_shards else wav_path
+        wav_file.parent.mkdir(parents=True, exist_ok=True)
+        # Fuera de los shards se renderiza a un temporal y se renombra al terminar
+        render_file = wav_file if to_shards else temp_path(wav_file)
+        code, _ = RENDER_BACKENDS[backend](midi_file, render_file, sample_rate)
+        if code != 0:
+            render_file.unlink(missing_ok=True)
+            return code, None, None
+        if render_file != wav_file:
+            os.replace(render_file, wav_file)
+        wav_data = wav_file.read_bytes() if to_shards else None
+        audio = read_wav(wav_file)[0] if keep_audio else None
+        return code, wav_data, audio
+
+
+def run_pipeline(
+    progression: str,
+    name: str,
+    roman_sequence: list = None,
+    progression_name: str = None,
+    tempo: int = DEFAULT_TEMPO,
+    seed: int = None,
+    sample_rate: int = DEFAULT_SAMPLE_RATE,
+    backend: str = DEFAULT_RENDER_BACKEND,
+    write_midi: bool = False,
+    output_dir=MIDI_DIR,
+    max_workers: int = DEFAULT_MAX_WORKERS,
+    queue_size: int = 64,
+    shard_dir=None,
+    corpus_dir=None
+) -> dict:
+    """
+    Genera, renderiza y anota una progresión en una sola pasada, sin volver a
+    recorrer el sistema de archivos.
+
+    La tonalidad de cada .jams es la tónica de su voz (ej. 'Eb' para los
+    archivos 'Eb-3-...'), en lugar de una única tonalidad para toda la carpeta.
+
+    :param progression: Progresión con comas, ej. "ii,7-V,7-I,maj7".
+    :param name: Nombre de la progresión (carpeta y nombres de archivo).
+    :param roman_sequence: Numerales para las anotaciones (por defecto, los de la progresión).
+    :param progression_name: Título de los .jams (por defecto, `name`).
+    :param tempo: BPM.
+    :param seed: Semilla para velocities y duraciones (ver iter_voicings). Si es
+                 None se elige una nueva, que se imprime y se retorna en el resumen.
+    :param sample_rate: Frecuencia de muestreo.
+    :param backend: Backend de render ('timidity' o 'synth').
+    :param write_midi: Si es True, además guarda los .mid y durations.jsonl en output_dir/name.
+    :param output_dir: Carpeta base de los .mid (solo si write_midi=True).
+    :param max_workers: Número de hilos de render.
+    :param queue_size: Capacidad de cada cola entre etapas.
+    :param shard_dir: Si se indica, en lugar de .wav y .jams sueltos se escribe un
+                      registro por voz (campos 'midi', 'audio' y 'jams') en los
+                      shards de shard_dir/name (ver shards.py).
+    :param corpus_dir: Si se indica, además se construye ahí un corpus memmap con el
+                       audio de todas las voces y sus acordes alineados (ver corpus.py).
+    :return: Resumen con 'total', 'rendered', 'failed' (lista de (archivo, código)),
+             'annotated', 'seed' (la usada, para reproducir la ejecución) y 'elapsed'
+             (segundos).
+    """
+    if backend not in RENDER_BACKENDS:
+        raise ValueError(
+            f"[pipeline] Backend no reconocido: {backend} "
+            f"(opciones: {', '.join(RENDER_BACKENDS)})"
+        )
+    if roman_sequence is None:
+        roman_sequence = progression.split("-")
+    if progression_name is None:
+        progression_name = name
+    # Se fija antes de lanzar los hilos para poder reportarla
+    seed = resolve_seed(seed)
+
+    midi_path = Path(output_dir) / name
+    durations_writer = None
+    if write_midi:
+        midi_path.mkdir(parents=True, exist_ok=True)
+        durations_writer = DurationsWriter(midi_path)
+    to_shards = shard_dir is not None
+    writer = ShardWriter(Path(shard_dir) / name) if to_shards else None
+    corpus = AudioCorpusWriter(corpus_dir, sample_rate) if corpus_dir is not None else None
+    seconds_per_beat = 60.0 / tempo
+
+    num_workers = max(1, max_workers)
+    render_q = queue.Queue(maxsize=queue_size)
+    annotate_q = queue.Queue(maxsize=queue_size)
+    summary = {"total": 0, "rendered": 0, "failed": [], "annotated": 0, "seed": seed, "elapsed": 0.0}
+    errors = []
+    start = time.perf_counter()
+
+    # Tras un error, las etapas dejan de trabajar pero siguen vaciando sus
+    # colas, para que ningún hilo quede bloqueado en un put().
+    def produce():
+        try:
+            for voicing in iter_voicings(progression, name, seed=seed):
+                if errors:
+                    break
+                midi_file = None
+                midi_data = voicing_to_midi_bytes(voicing, tempo) if (write_midi or to_shards) else None
+                if write_midi:
+                    midi_file = midi_path / voicing.filename
+                    midi_file.write_bytes(midi_data)
+                    durations_writer.add(voicing.filename, voicing.durations)
+                summary["total"] += 1
+                render_q.put((voicing, midi_file, midi_data))
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            for _ in range(num_workers):
+                render_q.put(_DONE)
+
+    def render():
+        while True:
+            item = render_q.get()
+            if item is _DONE:
+                break
+            if errors:
+                continue
+            voicing, midi_file, midi_data = item
+            try:
+                code, wav_data, audio = _render_voicing(
+                    voicing, midi_file, tempo, sample_rate, backend,
+                    to_shards, keep_audio=corpus is not None, name=name
+                )
+            except Exception as exc:
+                errors.append(exc)
+                continue
+            annotate_q.put((voicing, code, midi_data, wav_data, audio))
+        annotate_q.put(_DONE)
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [threading.Thread(target=render, daemon=True) for _ in range(num_workers)]
+    for t in threads:
+        t.start()
+
+    # Etapa de anotación en el hilo principal
+    finished = 0
+    while finished < num_workers:
+        item = annotate_q.get()
+        if item is _DONE:
+            finished += 1
+            continue
+        voicing, code, midi_data, wav_data, audio = item
+        if errors:
+            continue
+        if code != 0:
+            summary["failed"].append((voicing.filename, code))
+            continue
+        summary["rendered"] += 1
+        stem = Path(voicing.filename).stem
+        try:
+            if to_shards:
+                jam = build_jams(roman_sequence, voicing.key, progression_name, voicing.durations)
+                writer.add(stem, midi=midi_data, audio=wav_data, jams=jams_to_bytes(jam))
+            else:
+                create_jams_file(
+                    roman_sequence=roman_sequence,
+                    key=voicing.key,
+                    jam_name=artifact_relpath(
+                        name, voicing.filename, voicing.key, voicing.octave, ""
+                    ).as_posix(),
+                    progression_name=progression_name,
+                    durations=voicing.durations
+                )
+            if corpus is not None:
+                chords = []
+                onset = 0.0
+                for roman, dur in zip(roman_sequence, voicing.durations):
+                    label = roman_to_chord_label(roman, voicing.key)
+                    chords.append((onset, dur * seconds_per_beat, label))
+                    onset += dur * seconds_per_beat
+                corpus.add(stem, audio, chords)
+        except Exception as exc:
+            errors.append(exc)
+            continue
+        summary["annotated"] += 1
+
+    for t in threads:
+        t.join()
+    if writer is not None:
+        writer.close()
+    if durations_writer is not None:
+        durations_writer.close()
+    if corpus is not None:
+        corpus.close()
+    if errors:
+        raise errors[0]
+
+    summary["elapsed"] = time.perf_counter() - start
+    instrumentation.add_time("pipeline.total", summary["elapsed"])
+    instrumentation.flush("pipeline")
+    print(
+        f"Pipeline '{progression}' (seed={seed}): {summary['annotated']}/{summary['total']} voces "
+        f"renderizadas y anotadas en {summary['elapsed']:.1f}s "
+        f"({len(summary['failed'])} fallidas)"
+    )
+    return summary
@@ -6,8 +6,21 @@ Módulo: roman_to_chord
 Provee funciones para mapear un numeral romano (I, ii, V7, etc.)
 a una etiqueta de acorde compatible con JAMS (p.ej. 'C:maj7', 'D:min7', 'G:7'),
 para tonalidades mayores o menores, permitiendo notación # y b en la tónica.
+
+El numeral se analiza en un `Chord` de chord_theory (el mismo núcleo que usa
+la generación para las notas), así que etiqueta y notas siempre coinciden. Las
+etiquetas se resuelven detrás de una caché LRU por (numeral, tonalidad), con
+estadísticas en `label_cache_info()`, y `progression_labels` resuelve una
+progresión entera en las 12 tonalidades de una vez.
 """
 
+import re
+from functools import lru_cache
+
+from .chord_theory import (
+    MODES, PITCH_NAMES, QUALITIES, SCALES, Chord, parse_chord
+)
+
 
 # 1) Diccionarios básicos de notas
 
@@ -26,58 +39,52 @@ NOTE_TO_INT = {
 
 # Transformación inversa (0..11 -> una forma de notación)
 # Escogemos la forma # como principal
-INT_TO_NOTE = {
-    0: "C",   1: "C#",  2: "D",   3: "D#",
-    4: "E",   5: "F",   6: "F#",  7: "G",
-    8: "G#",  9: "A",  10: "A#", 11: "B"
-}
+INT_TO_NOTE = dict(enumerate(PITCH_NAMES))
 
 
-# 2) Escalas para tonalidad mayor/menor
+# 2) Escalas y modos
 
-MAJOR_SCALE_INTERVALS = [0, 2, 4, 5, 7, 9, 11]  # I, II, III, IV, V, VI, VII
-NATURAL_MINOR_INTERVALS = [0, 2, 3, 5, 7, 8, 10]  # i, ii°, III, iv, v, VI, VII
+MAJOR_SCALE_INTERVALS = list(SCALES["major"])  # I, II, III, IV, V, VI, VII
+NATURAL_MINOR_INTERVALS = list(SCALES["minor"])  # i, ii°, III, iv, v, VI, VII
 
+# Nombres aceptados en la tonalidad (tras la tónica, sin distinguir mayúsculas)
+MODE_ALIASES = {
+    "": "major", "maj": "major", "major": "major", "ionian": "major",
+    "m": "minor", "min": "minor", "minor": "minor", "aeolian": "minor",
+    "dorian": "dorian", "phrygian": "phrygian", "lydian": "lydian",
+    "mixolydian": "mixolydian", "locrian": "locrian",
+    "harmonic minor": "harmonic_minor", "harmonic_minor": "harmonic_minor",
+    "melodic minor": "melodic_minor", "melodic_minor": "melodic_minor",
+}
+
+_KEY_RE = re.compile(r"\s*(?P<root>[A-G][#b]?)\s*:?\s*(?P<mode>.*?)\s*")
+
+@lru_cache(maxsize=None)
 def parse_key(key_str: str):
     """
-    Dado un string de tonalidad (ej. 'C', 'Am', 'Abm', 'F#', etc.),
-    retorna (root_int, scale_type), donde:
+    Dado un string de tonalidad (ej. 'C', 'Am', 'Abm', 'F#', 'D dorian',
+    'G:mixolydian', 'A harmonic minor'), retorna (root_int, scale_type), donde:
       - root_int es el semitono base (0..11)
-      - scale_type es 'major' o 'minor'
-    Si la clave no se reconoce, fallback -> (0, 'major') => C mayor.
+      - scale_type es una escala de MODES ('major', 'minor', 'dorian'...)
+    Una tonalidad no reconocida lanza ValueError (antes se tomaba C mayor, lo
+    que etiquetaba mal en silencio todos los archivos de la carpeta).
     """
-    # Ejemplos: "Am" => root="A", minor
-    #           "C" => root="C", major
-    #           "F#m" => root="F#", minor
-    #           "Abm" => root="Ab", minor
-    # Verificamos si termina en 'm'
-    k = key_str.strip()
-    if k.lower().endswith("m"):
-        # Tonalidad menor
-        root_part = k[:-1]  # todo menos la 'm'
-        scale_type = "minor"
-    else:
-        root_part = k
-        scale_type = "major"
-
-    root_part = root_part.strip()
-    # Convertimos la raíz a semitonos
-    if root_part not in NOTE_TO_INT:
-        # fallback
-        return 0, "major"  # C mayor
-    root_int = NOTE_TO_INT[root_part]
-
-    return root_int, scale_type
+    match = _KEY_RE.fullmatch(key_str)
+    mode = match and MODE_ALIASES.get(" ".join(match.group("mode").lower().split()))
+    if mode is None or match.group("root") not in NOTE_TO_INT:
+        raise ValueError(
+            f"[roman_to_chord] Tonalidad no reconocida: {key_str!r} "
+            f"(ej. 'C', 'Am', 'D dorian'; modos: {', '.join(MODES)})"
+        )
+    return NOTE_TO_INT[match.group("root")], mode
 
 def get_scale_intervals(scale_type: str):
     """
-    Retorna la lista de semitonos para la escala (major o minor).
-    Por simplicidad, solo manejamos mayor o menor natural.
+    Retorna la lista de semitonos de la escala (un nombre de MODES).
     """
-    if scale_type == "minor":
-        return NATURAL_MINOR_INTERVALS
-    # default => major
-    return MAJOR_SCALE_INTERVALS
+    if scale_type not in SCALES:
+        raise ValueError(f"[roman_to_chord] Escala no reconocida: {scale_type} (opciones: {', '.join(MODES)})")
+    return list(SCALES[scale_type])
 
 
 # 3) Lógica para parsear numeral romano
@@ -181,73 +188,75 @@ def get_scale_intervals(scale_type: str):
 
 #     return chord_label
 
-def roman_to_chord_label(roman: str, key: str = "C") -> str:
-    """
-    Convierte un numeral romano (por ej. 'I', 'ii', 'V7', 'iv,7', etc.)
-    a una etiqueta de acorde JAMS (por ej. 'C:maj7', 'D:min7', 'G:7'),
-    asumiendo la tonalidad dada (p. ej. 'A', 'Am', 'Eb', 'F#m').
+# Sufijos reconocidos (calidades de chord_theory)
+CHORD_SUFFIXES = list(QUALITIES)
 
-    Soporta los siguientes sufijos:
-    min, maj, dim, aug, min6, maj6, min7, minmaj7, maj7, 7, dim7, hdim7, sus2, sus4
+LABEL_CACHE_SIZE = 4096
+
+
+def parse_numeral(roman: str) -> Chord:
+    """
+    Analiza un numeral romano con alteración y sufijo opcionales ('V7',
+    'ii,min7', 'bVII', 'IV,#,maj7'); ver chord_theory.parse_chord.
     """
+    return parse_chord(roman)
 
-    # 1) Parse tonalidad -> (root_int, scale_type)
+
+@lru_cache(maxsize=LABEL_CACHE_SIZE)
+def _resolve_label(roman: str, key: str) -> str:
     root_key_int, scale_type = parse_key(key)
+    return parse_chord(roman).label(root_key_int, scale_type)
+
 
-    # 2) Definir la escala
-    scale_intervals = get_scale_intervals(scale_type)
+def label_cache_info() -> dict:
+    """
+    Estadísticas de la caché de etiquetas: {'hits', 'misses', 'size', 'maxsize'}.
+    """
+    info = _resolve_label.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
 
-    # 3) Parse numeral: base + sufijo
-    r = roman.strip()
-    suffix = ""
 
-    possible_suffixes = [
-        "min", "maj", "dim", "aug",
-        "min6", "maj6",
-        "min7", "minmaj7", "maj7", "7", "dim7", "hdim7",
-        "sus2", "sus4"
-    ]
+def clear_label_cache():
+    _resolve_label.cache_clear()
+    parse_chord.cache_clear()
+
+
+def progression_labels(roman_sequence: list, keys: list = None) -> dict:
+    """
+    Etiquetas JAMS de una progresión en varias tonalidades de una vez: cada
+    numeral se analiza una sola vez y en cada tonalidad solo se suma la raíz.
+
+    :param roman_sequence: Numerales (ej. ['ii,7', 'V,7', 'I,maj7']).
+    :param keys: Tonalidades (por defecto las 12 mayores, de INT_TO_NOTE).
+    :return: {tonalidad: tupla de etiquetas}
+    """
+    if keys is None:
+        keys = [INT_TO_NOTE[pc] for pc in range(12)]
+    chords = [parse_chord(roman) for roman in roman_sequence]
+    labels = {}
+    for key in keys:
+        root_key_int, scale_type = parse_key(key)
+        labels[key] = tuple(chord.label(root_key_int, scale_type) for chord in chords)
+    return labels
+
 
-    # Busca sufijo separado por coma
-    if "," in r:
-        base_part, suffix = r.split(",", 1)
-        base_part = base_part.strip()
-        suffix = suffix.strip()
-    else:
-        # Si no hay coma, busca sufijo al final del string
-        r_lower = r.lower()
-        found_suf = None
-        for suf in possible_suffixes:
-            if r_lower.endswith(suf):
-                found_suf = suf
-                break
-        if found_suf:
-            suffix = found_suf
-            base_part = r[:-len(suffix)].strip()
-        else:
-            base_part = r
-
-    # Mapeo numeral -> índice en escala
-    roman_map = {"i": 0, "ii": 1, "iii": 2, "iv": 3, "v": 4, "vi": 5, "vii": 6}
-    base_lower = base_part.lower()
-    if base_lower not in roman_map:
-        raise ValueError(f"Numeral romano no reconocido: {base_part}")
-
-    scale_index = roman_map[base_lower]
-
-    # Calcular nota raíz del acorde
-    offset = scale_intervals[scale_index]
-    chord_root_int = (root_key_int + offset) % 12
-    note_name = INT_TO_NOTE[chord_root_int]
-
-    # Si no hay sufijo, aplicar por defecto maj/min según mayúscula
-    if not suffix:
-        is_upper = base_part[0].isupper()
-        triad_qual = "maj" if is_upper else "min"
-        return f"{note_name}:{triad_qual}"
-
-    # Retornar etiqueta JAMS final
-    return f"{note_name}:{suffix}"
+def roman_to_chord_label(roman: str, key: str = "C") -> str:
+    """
+    Convierte un numeral romano (por ej. 'I', 'ii', 'V7', 'iv,7', etc.)
+    a una etiqueta de acorde JAMS (por ej. 'C:maj7', 'D:min7', 'G:7'),
+    asumiendo la tonalidad dada (p. ej. 'A', 'Am', 'Eb', 'F#m').
+
+    Soporta los siguientes sufijos:
+    min, maj, dim, aug, min6, maj6, min7, minmaj7, maj7, 7, dim7, hdim7, sus2, sus4,
+    9, maj9, min9, 11, min11, 13, maj13, min13, 7b9, 7#9, 7#11, 7alt
+    (ver chord_theory.QUALITIES; las alteradas se etiquetan como 'G:7(b9)').
+
+    El numeral puede llevar una alteración ('bVII', '#iv', 'IV,#,maj7'). Con
+    sufijo '7', un numeral en minúscula es menor séptima ('ii,7' -> 'D:min7'),
+    igual que las notas que genera generate_progression. Los resultados se
+    memorizan por (numeral, tonalidad), ver label_cache_info().
+    """
+    return _resolve_label(roman, key)
 
 
 
@@ -293,12 +302,51 @@ def test_roman_to_chord():
         ("IV,aug", "Eb"),  # Ab:aug
         ("vi,maj6", "D"),  # B:maj6
         ("i,min6", "Em"),  # E:min6
+        ("V7", "F"),       # C:7
+        ("bVII", "C"),     # A#:maj
+        ("IV,#,maj7", "C"),  # F#:maj7
+        ("viidim7", "C"),  # B:dim7
     ]
 
     for roman, key_name in examples:
         label = roman_to_chord_label(roman, key_name)
         print(f"roman_to_chord_label({roman}, {key_name}) => {label}")
 
+    # Una progresión en las 12 tonalidades mayores de una vez
+    labels = progression_labels(["ii,min7", "V,7", "I,maj7"])
+    assert labels["C"] == ("D:min7", "G:7", "C:maj7")
+    assert labels["F#"] == tuple(roman_to_chord_label(r, "F#") for r in ["ii,min7", "V,7", "I,maj7"])
+    print(f"progression_labels(ii,min7-V,7-I,maj7) en A => {labels['A']}")
+
+    # Modos, menores armónica / melódica y dominantes secundarias
+    assert roman_to_chord_label("VII", "D dorian") == "C:maj"
+    assert roman_to_chord_label("bVII,7", "G mixolydian") == "E:7"
+    assert roman_to_chord_label("V,7", "A harmonic minor") == "E:7"
+    assert roman_to_chord_label("vi,hdim7", "C:melodic_minor") == "A:hdim7"
+    assert roman_to_chord_label("V/V", "C") == "D:maj"
+    assert roman_to_chord_label("V,7/ii", "F") == "D:7"
+    assert roman_to_chord_label("vii,dim7/ii", "C") == "C#:dim7"
+    assert roman_to_chord_label("V7/VII", "Ebm") == "G#:7"
+
+    # Extensiones y dominantes alteradas
+    assert roman_to_chord_label("ii,9", "C") == "D:min9"
+    assert roman_to_chord_label("V13", "C") == "G:13(*11)"
+    assert roman_to_chord_label("V,7b9", "F") == "C:7(b9)"
+    assert roman_to_chord_label("V7alt/ii", "C") == "A:7(*5,b9,#9,b13)"
+    for mode in MODES:
+        for root in range(12):
+            key = f"{INT_TO_NOTE[root]} {mode}"
+            for roman in ("I", "ii,7", "iii", "IV,#,maj7", "V/V", "vi", "bVII"):
+                chord = parse_chord(roman)
+                assert roman_to_chord_label(roman, key) == chord.label(root, mode)
+    for key in ("H", "C lydian dominant", "", "Cmajor7"):
+        try:
+            parse_key(key)
+        except ValueError:
+            continue
+        raise AssertionError(f"parse_key({key!r}) debería fallar")
+    print(f"Caché de etiquetas: {label_cache_info()}")
+
 
 if __name__ == "__main__":
 
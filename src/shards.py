@@ -0,0 +1,164 @@
+#!/usr/bin/env python
+
+"""
+Módulo: shards
+--------------
+Formato de dataset fragmentado (shards) para no generar decenas de miles de
+archivos pequeños. Cada muestra se guarda como un registro contiguo dentro de
+archivos `shard-00000.bin` de tamaño acotado, con sus campos (MIDI, audio,
+anotación...) concatenados. Un `index.jsonl` indica, por muestra, el shard,
+el offset y la longitud de cada campo, así que leer cualquier muestra cuesta
+un solo seek.
+"""
+
+import json
+import threading
+from pathlib import Path
+
+from .config import DEFAULT_SHARD_SIZE
+
+INDEX_NAME = "index.jsonl"
+
+
+def shard_name(number: int) -> str:
+    return f"shard-{number:05d}.bin"
+
+
+class ShardWriter:
+    """
+    Escritor de shards. Es seguro usarlo desde varios hilos.
+
+    :param folder: Carpeta del dataset (se crea si no existe).
+    :param shard_size: Tamaño máximo aproximado de cada shard en bytes.
+    :param append: Si es False (por defecto), los shards y el índice que ya
+                   tuviera la carpeta se borran: volver a generar un dataset lo
+                   reemplaza en lugar de duplicarlo. Si es True, se añaden
+                   shards nuevos a continuación de los existentes.
+    """
+
+    def __init__(self, folder: Path, shard_size: int = DEFAULT_SHARD_SIZE, append: bool = False):
+        self.folder = Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.shard_size = shard_size
+        self._lock = threading.Lock()
+        existing = sorted(self.folder.glob("shard-*.bin"))
+        if not append:
+            for path in existing:
+                path.unlink()
+            existing = []
+        self._shard_number = len(existing)
+        self._shard = None
+        self._offset = 0
+        self._index = open(self.folder / INDEX_NAME, "a" if append else "w")
+
+    def _open_next_shard(self):
+        if self._shard is not None:
+            self._shard.close()
+            self._shard_number += 1
+        self._shard = open(self.folder / shard_name(self._shard_number), "wb")
+        self._offset = 0
+
+    def add(self, sample_id: str, **fields: bytes):
+        """
+        Añade una muestra. Ej: writer.add("C-2-ii7-V7-I-0", midi=b"...", audio=b"...").
+        """
+        record = b"".join(fields.values())
+        entry_fields = [[field, len(data)] for field, data in fields.items()]
+        with self._lock:
+            if self._shard is None or (
+                self._offset > 0 and self._offset + len(record) > self.shard_size
+            ):
+                self._open_next_shard()
+            entry = {
+                "id": sample_id,
+                "shard": self._shard_number,
+                "offset": self._offset,
+                "fields": entry_fields,
+            }
+            self._shard.write(record)
+            self._offset += len(record)
+            self._index.write(json.dumps(entry) + "\n")
+
+    def close(self):
+        with self._lock:
+            if self._shard is not None:
+                self._shard.close()
+                self._shard = None
+            self._index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ShardReader:
+    """
+    Lector de un dataset en shards con acceso aleatorio por id de muestra.
+
+    :param folder: Carpeta del dataset (la de ShardWriter).
+    """
+
+    def __init__(self, folder: Path):
+        self.folder = Path(folder)
+        self._entries = {}
+        with open(self.folder / INDEX_NAME, "r") as f:
+            for line in f:
+                entry = json.loads(line)
+                self._entries[entry["id"]] = entry
+        self._files = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, sample_id):
+        return sample_id in self._entries
+
+    def ids(self) -> list:
+        return list(self._entries)
+
+    def _read(self, shard: int, offset: int, length: int) -> bytes:
+        if shard not in self._files:
+            self._files[shard] = open(self.folder / shard_name(shard), "rb")
+        fh = self._files[shard]
+        fh.seek(offset)
+        return fh.read(length)
+
+    def read(self, sample_id: str) -> dict:
+        """
+        Lee todos los campos de una muestra (un seek + una lectura).
+        :return: {campo: bytes}
+        """
+        entry = self._entries[sample_id]
+        total = sum(length for _, length in entry["fields"])
+        blob = self._read(entry["shard"], entry["offset"], total)
+        out = {}
+        pos = 0
+        for field, length in entry["fields"]:
+            out[field] = blob[pos:pos + length]
+            pos += length
+        return out
+
+    def read_field(self, sample_id: str, field: str) -> bytes:
+        """
+        Lee solo un campo de una muestra (un seek + una lectura).
+        """
+        entry = self._entries[sample_id]
+        offset = entry["offset"]
+        for name, length in entry["fields"]:
+            if name == field:
+                return self._read(entry["shard"], offset, length)
+            offset += length
+        raise KeyError(f"[ShardReader] La muestra {sample_id} no tiene el campo '{field}'")
+
+    def close(self):
+        for fh in self._files.values():
+            fh.close()
+        self._files = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
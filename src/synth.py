@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+
+"""
+Módulo: synth
+-------------
+Sintetizador aditivo vectorizado con NumPy. Convierte listas de notas
+(pitch, inicio_seg, duración_seg, velocity) directamente en un buffer de audio,
+sin pasar por timidity ni por disco.
+"""
+
+import io
+import wave
+from functools import lru_cache
+from pathlib import Path
+
+import numpy as np
+
+from .config import DEFAULT_SAMPLE_RATE
+from .build_cache import atomic_write
+
+WAVETABLE_SIZE = 2048  # potencia de 2
+_TABLE_SHIFT = 32 - (WAVETABLE_SIZE.bit_length() - 1)
+# Amplitudes relativas de los parciales (timbre tipo piano eléctrico suave)
+HARMONIC_AMPLITUDES = (1.0, 0.5, 0.25, 0.12, 0.06, 0.03)
+
+ATTACK_SECONDS = 0.01
+DECAY_RATE = 1.5       # decaimiento exponencial (1/s) durante la nota
+RELEASE_SECONDS = 0.3  # cola tras el note-off
+
+# Frecuencia de cada pitch MIDI 0..127
+PITCH_HZ = 440.0 * 2.0 ** ((np.arange(128) - 69) / 12.0)
+
+
+@lru_cache(maxsize=None)
+def _wavetable() -> np.ndarray:
+    """
+    Tabla de un ciclo con la suma de parciales, normalizada a [-1, 1].
+    """
+    phase = np.arange(WAVETABLE_SIZE) / WAVETABLE_SIZE
+    table = sum(
+        amp * np.sin(2 * np.pi * (k + 1) * phase)
+        for k, amp in enumerate(HARMONIC_AMPLITUDES)
+    )
+    return (table / np.abs(table).max()).astype(np.float32)
+
+
+def _envelope(num_samples: int, hold_samples: int, sample_rate: int) -> np.ndarray:
+    """
+    Envolvente ataque/decaimiento/release de `num_samples` muestras, donde las
+    primeras `hold_samples` corresponden a la nota sostenida.
+    """
+    t = np.arange(num_samples) / sample_rate
+    env = np.minimum(t / ATTACK_SECONDS, 1.0) * np.exp(-DECAY_RATE * t)
+    if num_samples > hold_samples:
+        level = env[hold_samples - 1] if hold_samples > 0 else 0.0
+        release = np.linspace(1.0, 0.0, num_samples - hold_samples, endpoint=False)
+        env[hold_samples:] = level * release
+    return env.astype(np.float32)
+
+
+def render_notes(notes, sample_rate: int = DEFAULT_SAMPLE_RATE) -> np.ndarray:
+    """
+    Sintetiza una lista de notas a un buffer mono float32 en [-1, 1].
+
+    Las notas que comparten inicio y duración (un acorde) se renderizan juntas:
+    un banco de osciladores (una fila por nota) leído de la misma tabla de onda
+    y multiplicado por una única envolvente.
+
+    :param notes: Iterable de tuplas (pitch, inicio_seg, duración_seg, velocity).
+    :param sample_rate: Frecuencia de muestreo (por defecto la de config.py).
+    :return: Array float32 con el audio.
+    """
+    notes = list(notes)
+    if not notes:
+        return np.zeros(0, dtype=np.float32)
+
+    release = int(RELEASE_SECONDS * sample_rate)
+    total = max(int(round((n[1] + n[2]) * sample_rate)) for n in notes) + release
+    out = np.zeros(total, dtype=np.float32)
+    table = _wavetable()
+
+    # Agrupar por (inicio, duración) => un bloque vectorizado por acorde
+    groups = {}
+    for pitch, onset, duration, velocity in notes:
+        groups.setdefault((onset, duration), []).append((pitch, velocity))
+
+    for (onset, duration), members in groups.items():
+        start = int(round(onset * sample_rate))
+        hold = int(round(duration * sample_rate))
+        length = min(hold + release, total - start)
+        pitches = np.array([m[0] for m in members])
+        gains = np.array([m[1] for m in members], dtype=np.float32) / 127.0
+
+        # Fase en punto fijo de 32 bits (el desborde de uint32 hace el módulo);
+        # los bits altos indexan la tabla. Resultado: (notas, muestras)
+        steps = np.round(PITCH_HZ[pitches] * 2.0 ** 32 / sample_rate).astype(np.uint32)
+        phase = steps[:, None] * np.arange(length, dtype=np.uint32)
+        bank = table[phase >> _TABLE_SHIFT]
+        out[start:start + length] += (gains @ bank) * _envelope(length, hold, sample_rate)
+
+    peak = np.abs(out).max()
+    if peak > 1.0:
+        out /= peak
+    return out
+
+
+def encode_wav(audio: np.ndarray, sample_rate: int = DEFAULT_SAMPLE_RATE) -> bytes:
+    """
+    Codifica un buffer float en [-1, 1] como bytes de un WAV mono de 16 bits.
+    """
+    pcm = (np.clip(audio, -1.0, 1.0) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(sample_rate)
+        wf.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def write_wav(wav_file: Path, audio: np.ndarray, sample_rate: int = DEFAULT_SAMPLE_RATE) -> Path:
+    """
+    Guarda un buffer float en [-1, 1] como WAV mono de 16 bits (escritura atómica).
+    """
+    wav_file = Path(wav_file)
+    wav_file.parent.mkdir(parents=True, exist_ok=True)
+    atomic_write(wav_file, encode_wav(audio, sample_rate))
+    return wav_file
+
+
+def read_wav(wav_file: Path) -> tuple:
+    """
+    Lee un WAV PCM de 16 bits (mono o estéreo) como buffer mono float32 en [-1, 1].
+
+    :return: (audio, sample_rate)
+    """
+    with wave.open(str(wav_file), "rb") as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"[synth] Solo se soporta PCM de 16 bits: {wav_file}")
+        channels = wf.getnchannels()
+        sample_rate = wf.getframerate()
+        pcm = np.frombuffer(wf.readframes(wf.getnframes()), dtype="<i2")
+    audio = pcm.reshape(-1, channels).mean(axis=1) / 32767.0
+    return audio.astype(np.float32), sample_rate